@@ -0,0 +1,98 @@
+"""
+In-process cache with per-entry expiry and a size bound
+Keeps short-lived per-user state (search results, search mode) bounded in memory
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire a fixed number of seconds after being set"""
+    
+    __slots__ = ("ttl", "maxsize", "_data", "_lock", "_clock", "_versions", "_version_floor")
+    
+    def __init__(self, ttl: float, maxsize: Optional[int] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # key -> (expires_at, value), least recently used first
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> stamp of its last invalidate(), oldest first, so a fill computed
+        # before it can be rejected; keys dropped to bound the map read as the
+        # newest dropped stamp, which only ever rejects more
+        self._clock = 0
+        self._versions: OrderedDict = OrderedDict()
+        self._version_floor = 0
+    
+    def version(self, key: Hashable) -> int:
+        """Stamp to read before computing a value for set_if_unchanged()"""
+        with self._lock:
+            return self._versions.get(key, self._version_floor)
+    
+    def set(self, key: Hashable, value: Any):
+        """Store value under key, resetting its expiry"""
+        with self._lock:
+            self._store(key, value)
+    
+    def set_if_unchanged(self, key: Hashable, value: Any, version: int) -> bool:
+        """Store value unless key was invalidated since version was read"""
+        with self._lock:
+            if self._versions.get(key, self._version_floor) != version:
+                return False
+            self._store(key, value)
+            return True
+    
+    def invalidate(self, key: Hashable):
+        """Remove key and reject any set_if_unchanged() fill for it that started before this call"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._clock += 1
+            self._versions.pop(key, None)
+            self._versions[key] = self._clock
+            if self.maxsize is not None and len(self._versions) > self.maxsize:
+                self._version_floor = self._versions.popitem(last=False)[1]
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key and return its value (default if missing or expired)"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+    
+    def __len__(self) -> int:
+        """Number of stored entries, including expired ones not yet purged"""
+        return len(self._data)
+    
+    def _store(self, key: Hashable, value: Any):
+        """Insert or refresh an entry, evicting the oldest beyond maxsize (caller holds the lock)"""
+        now = time.monotonic()
+        self._purge(now)
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def _purge(self, now: float):
+        """Drop expired entries from the least recently used end (caller holds the lock)"""
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
@@ -4,66 +4,106 @@ Handles environment variables and bot settings
 """
 
 import os
-from typing import List
+import base64
+from typing import Optional
 
 class Config:
     """Configuration class for bot settings"""
     
-    def __init__(self):
-        # Bot credentials
-        self.BOT_TOKEN = os.getenv(
-            "BOT_TOKEN", 
-            "7672506977:AAHkuMEnxue3gQdWqWiJqSNmYZUOG5yhCTM"
-        )
-        
-        # Search API credentials
-        self.SERPAPI_KEY = os.getenv(
-            "SERPAPI_KEY", 
-            "7f676acb5e4a0a2869dbc8828085f45aa931117db18bcde689c6abcc3ff82187"
-        )
-        
-        # Developer info (encoded)
-        import base64
-        self.DEVELOPER_TELEGRAM = base64.b64decode("QE5HWVQ3NzdHRw==").decode('utf-8')
-        self.CHANNEL_LINK = base64.b64decode("aHR0cHM6Ly90Lm1lLytGTnN0Tllfb29WMWxZemRs").decode('utf-8')
-        
-        # Search settings
-        self.MAX_RESULTS_PER_PAGE = 5
-        self.MAX_SEARCH_HISTORY = 20
-        self.MAX_FAVORITES = 50
-        
-        # Supported platforms
-        self.SUPPORTED_PLATFORMS = [
-            "drive.google.com",
-            "mediafire.com", 
-            "mega.nz",
-            "dropbox.com",
-            "onedrive.live.com"
-        ]
-        
-        # Search engines
-        self.SEARCH_ENGINES = ["google", "bing", "duckduckgo"]
-        
-        # Rate limiting
-        self.RATE_LIMIT_SEARCHES = 10  # per minute
-        self.RATE_LIMIT_WINDOW = 60    # seconds
-        
-        # Database settings
-        self.DATABASE_FILE = "course_bot.db"
-        
-        # Progress animation settings
-        self.PROGRESS_FRAMES = ["⏳", "⌛", "🔍", "📚", "🎯"]
-        self.PROGRESS_DELAY = 0.5  # seconds
-
+    # Developer info (encoded), decoded once at import
+    DEVELOPER_TELEGRAM = base64.b64decode("QE5HWVQ3NzdHRw==").decode('utf-8')
+    CHANNEL_LINK = base64.b64decode("aHR0cHM6Ly90Lm1lLytGTnN0Tllfb29WMWxZemRs").decode('utf-8')
+    
+    # No per-instance state: every setting is a class attribute read at import
+    __slots__ = ()
+    
+    # Bot credentials
+    BOT_TOKEN = os.getenv(
+        "BOT_TOKEN", 
+        "7672506977:AAHkuMEnxue3gQdWqWiJqSNmYZUOG5yhCTM"
+    )
+    
+    # Search API credentials
+    SERPAPI_KEY = os.getenv(
+        "SERPAPI_KEY", 
+        "7f676acb5e4a0a2869dbc8828085f45aa931117db18bcde689c6abcc3ff82187"
+    )
+    
+    # Telegram Bot API client
+    TELEGRAM_MAX_RETRIES = 3  # retries after a RetryAfter (flood control) error
+    
+    # Search settings
+    MAX_RESULTS_PER_PAGE = 5
+    MAX_SEARCH_HISTORY = 20
+    MAX_FAVORITES = 50
+    
+    # Supported platforms
+    SUPPORTED_PLATFORMS = (
+        "drive.google.com",
+        "mediafire.com", 
+        "mega.nz",
+        "dropbox.com",
+        "onedrive.live.com"
+    )
+    
+    # Display name and emoji per supported platform
+    PLATFORM_INFO = {
+        "drive.google.com": ("Google Drive", "📁"),
+        "mediafire.com": ("MediaFire", "💾"),
+        "mega.nz": ("Mega", "☁️"),
+        "dropbox.com": ("Dropbox", "📦"),
+        "onedrive.live.com": ("OneDrive", "🌐")
+    }
+    
+    # Search engines
+    SEARCH_ENGINES = ("google", "bing", "duckduckgo")
+    
+    # Rate limiting
+    RATE_LIMIT_SEARCHES = 10  # per minute
+    RATE_LIMIT_WINDOW = 60    # seconds
+    
+    # Per-user in-memory state lifetimes (seconds)
+    SEARCH_RESULT_TTL = 900
+    SEARCH_STATE_TTL = 300
+    CACHE_MAXSIZE = 10000  # entries per in-memory cache
+    
+    # Identical searches within this window (seconds) reuse the earlier results
+    SEARCH_CACHE_TTL = 600
+    
+    # Upstream searches allowed in flight at once; the rest wait their turn
+    MAX_CONCURRENT_SEARCHES = 16
+    SEARCH_KEEPALIVE_EXPIRY = 120  # seconds an idle SerpAPI connection stays open
+    
+    # Database settings
+    DATABASE_FILE = "course_bot.db"
+    DB_THREAD_POOL_SIZE = 8  # worker threads for blocking database calls
+    
+    # Progress animation settings
+    PROGRESS_FRAMES = ("⏳", "⌛", "🔍", "📚", "🎯")
+    PROGRESS_DELAY = 0.5  # seconds
+    
+    # Query templates never change once the platforms are set
+    _default_template = "{query} (" + " OR ".join(f"site:{p}" for p in SUPPORTED_PLATFORMS) + ")"
+    _platform_templates = {p: f"{{query}} site:{p}" for p in SUPPORTED_PLATFORMS}
+    
     def get_search_query_template(self, platform: str = None) -> str:
         """Get search query template for specific platform"""
         if platform:
-            return f"{{query}} site:{platform}"
-        else:
-            platforms = " OR ".join([f"site:{p}" for p in self.SUPPORTED_PLATFORMS])
-            return f"{{query}} ({platforms})"
+            template = self._platform_templates.get(platform)
+            return template if template else f"{{query}} site:{platform}"
+        return self._default_template
     
     def is_valid_platform(self, url: str) -> bool:
         """Check if URL belongs to supported platform"""
-        return any(platform in url.lower() for platform in self.SUPPORTED_PLATFORMS)
+        return self.match_platform(url) is not None
+    
+    @classmethod
+    def match_platform(cls, url: str) -> Optional[str]:
+        """Return the supported platform domain found in URL, or None"""
+        # Plain substring checks beat a regex alternation here
+        url_lower = url.lower()
+        for domain in cls.SUPPORTED_PLATFORMS:
+            if domain in url_lower:
+                return domain
+        return None
       
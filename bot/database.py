@@ -4,29 +4,177 @@ Uses SQLite for simplicity and portability
 """
 
 import sqlite3
-import json
+import functools
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Tuple
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Hot-path statements, kept as constants so every call reuses the same
+# text and hits the connection's prepared-statement cache
+_SQL_REPLACE_USER = '''
+    INSERT OR REPLACE INTO users
+    (user_id, username, first_name, last_name, last_active)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+'''
+
+_SQL_INSERT_HISTORY = '''
+    INSERT INTO search_history (user_id, query, results_count, timestamp)
+    VALUES (?, ?, ?, ?)
+'''
+
+_SQL_TRIM_HISTORY = '''
+    DELETE FROM search_history
+    WHERE user_id = ? AND id < (
+        SELECT id FROM search_history
+        WHERE user_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT 1 OFFSET ?
+    )
+'''
+
+_SQL_GET_HISTORY = '''
+    SELECT query, results_count, timestamp
+    FROM search_history
+    WHERE user_id = ?
+    ORDER BY timestamp DESC, id DESC
+    LIMIT ?
+'''
+
+_SQL_CREATE_FAVORITES = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        url TEXT NOT NULL,
+        platform TEXT,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, url),
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    ) WITHOUT ROWID
+'''
+
+# Aggregates over the latest searches only: rows past MAX_HISTORY are trimmed
+# lazily, so counting everything stored would drift between trims
+_SQL_GET_USER_STATS = '''
+    SELECT COUNT(*), COALESCE(SUM(results_count), 0),
+           (SELECT COUNT(*) FROM favorites WHERE user_id = ?)
+    FROM (
+        SELECT results_count
+        FROM search_history
+        WHERE user_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    )
+'''
+
+_SQL_INSERT_FAVORITE = '''
+    INSERT OR IGNORE INTO favorites (user_id, title, url, platform)
+    VALUES (?, ?, ?, ?)
+'''
+
+_SQL_GET_FAVORITES = '''
+    SELECT title, url, platform, added_at
+    FROM favorites
+    WHERE user_id = ?
+    ORDER BY added_at DESC
+'''
+
+_SQL_DELETE_FAVORITE = '''
+    DELETE FROM favorites
+    WHERE user_id = ? AND url = ?
+'''
+
+_SQL_GET_SETTINGS = '''
+    SELECT key, value FROM user_settings WHERE user_id = ?
+'''
+
+_SQL_SET_SETTING = '''
+    INSERT OR REPLACE INTO user_settings (user_id, key, value)
+    VALUES (?, ?, ?)
+'''
+
+_SQL_DELETE_SETTING = '''
+    DELETE FROM user_settings WHERE user_id = ? AND key = ?
+'''
+
+def _single_writer(method):
+    """Run a write method on the database's dedicated writer thread"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._local, "is_writer", False):
+            return method(self, *args, **kwargs)
+        return self._writer.submit(method, self, *args, **kwargs).result()
+    return wrapper
+
 class Database:
     """Database handler for bot data"""
     
+    # Files already switched to WAL (journal_mode is persisted in the file header)
+    _wal_files = set()
+    
+    # Files whose schema is known to be current in this process; bump
+    # SCHEMA_VERSION whenever init_database gains a new table or migration
+    _initialized_files = set()
+    SCHEMA_VERSION = 1
+    
+    # Search history kept per user, and how many inserts to batch between trims
+    MAX_HISTORY = 20
+    HISTORY_TRIM_INTERVAL = max(1, MAX_HISTORY // 10)
+    
+    # Queued history inserts are flushed at this many entries or this age (seconds)
+    HISTORY_FLUSH_SIZE = 50
+    HISTORY_FLUSH_INTERVAL = 5.0
+    
+    # Read caches (seconds); writes through this object invalidate or update them
+    SETTINGS_CACHE_TTL = 3600
+    LIST_CACHE_TTL = 60
+    CACHE_MAXSIZE = 10000
+    
     def __init__(self, db_file: str = "course_bot.db"):
         self.db_file = db_file
+        self._local = threading.local()
+        self._memory_conn = None
+        
+        # All writes are funnelled through one thread (and its connection) so
+        # writers never contend for the lock; reads run concurrently under WAL
+        self._writer = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="db-writer",
+            initializer=self._mark_writer_thread
+        )
+        self._writes_since_trim: Dict[int, int] = {}
+        self._settings_cache = TTLCache(self.SETTINGS_CACHE_TTL, self.CACHE_MAXSIZE)
+        self._favorites_cache = TTLCache(self.LIST_CACHE_TTL, self.CACHE_MAXSIZE)
+        self._history_cache = TTLCache(self.LIST_CACHE_TTL, self.CACHE_MAXSIZE)
+        self._pending_history: List[Tuple[int, str, int, str]] = []
+        self._pending_since = 0.0
+        self._pending_lock = threading.Lock()
         self.init_database()
     
+    @_single_writer
     def init_database(self):
         """Initialize database tables"""
+        if self.db_file in self._initialized_files:
+            return
+        
         try:
+            # user_version is stamped once the schema below has been applied
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= self.SCHEMA_VERSION:
+                    self._mark_initialized()
+                    return
+            
+            with self.transaction() as conn:
                 # Users table
-                cursor.execute('''
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS users (
                         user_id INTEGER PRIMARY KEY,
                         username TEXT,
@@ -39,7 +187,7 @@ class Database:
                 ''')
                 
                 # Search history table
-                cursor.execute('''
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS search_history (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         user_id INTEGER,
@@ -50,238 +198,347 @@ class Database:
                     )
                 ''')
                 
-                # Favorites table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS favorites (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        title TEXT NOT NULL,
-                        url TEXT NOT NULL,
-                        platform TEXT,
-                        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
+                # Favorites table, clustered on (user_id, url)
+                conn.execute(_SQL_CREATE_FAVORITES.format(table="favorites"))
+                
+                # Older versions used an AUTOINCREMENT id plus a separate unique
+                # index; rebuild those tables in place, keeping the first copy
+                # of any duplicated (user_id, url)
+                columns = conn.execute("PRAGMA table_info(favorites)").fetchall()
+                if any(column[1] == "id" for column in columns):
+                    conn.execute("DROP TABLE IF EXISTS favorites_new")
+                    conn.execute(_SQL_CREATE_FAVORITES.format(table="favorites_new"))
+                    conn.execute('''
+                        INSERT OR IGNORE INTO favorites_new (user_id, title, url, platform, added_at)
+                        SELECT user_id, title, url, platform, added_at
+                        FROM favorites ORDER BY id
+                    ''')
+                    conn.execute("DROP TABLE favorites")
+                    conn.execute("ALTER TABLE favorites_new RENAME TO favorites")
+                
+                # Rate limiting is kept in memory now
+                conn.execute("DROP TABLE IF EXISTS rate_limits")
+                
+                # Per-key user settings; value has no type affinity so ints,
+                # strings and booleans (stored as 0/1) come back as written
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS user_settings (
+                        user_id INTEGER NOT NULL,
+                        key TEXT NOT NULL,
+                        value,
+                        PRIMARY KEY (user_id, key)
+                    ) WITHOUT ROWID
                 ''')
                 
-                # Rate limiting table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS rate_limits (
-                        user_id INTEGER PRIMARY KEY,
-                        search_count INTEGER DEFAULT 0,
-                        window_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
+                # Move settings still stored as JSON in users.settings; a value
+                # that isn't a JSON object is dropped rather than failing the migration
+                invalid = conn.execute('''
+                    SELECT COUNT(*) FROM users
+                    WHERE settings NOT IN ('', '{}') AND
+                        CASE WHEN json_valid(settings) THEN json_type(settings) != 'object' ELSE 1 END
+                ''').fetchone()[0]
+                if invalid:
+                    logger.warning(f"Dropping {invalid} unreadable legacy settings values")
+                conn.execute('''
+                    INSERT OR IGNORE INTO user_settings (user_id, key, value)
+                    SELECT users.user_id, j.key, j.value
+                    FROM users, json_each(
+                        CASE
+                            WHEN NOT json_valid(users.settings) THEN '{}'
+                            WHEN json_type(users.settings) = 'object' THEN users.settings
+                            ELSE '{}'
+                        END
+                    ) AS j
+                    WHERE users.settings NOT IN ('', '{}')
+                ''')
+                conn.execute('''
+                    UPDATE users SET settings = '{}' WHERE settings NOT IN ('', '{}')
+                ''')
+                
+                # Indexes for the per-user lookups and ordered scans
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_history_user_ts
+                    ON search_history (user_id, timestamp)
+                ''')
+                
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_fav_user_added
+                    ON favorites (user_id, added_at DESC)
                 ''')
                 
-                conn.commit()
-                logger.info("Database initialized successfully")
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+                
+            self._mark_initialized()
+            logger.info("Database initialized successfully")
                 
         except Exception as e:
+            # Running on a half-built schema would fail every later call, so stop here
             logger.error(f"Database initialization failed: {e}")
+            raise
+    
+    def _mark_initialized(self):
+        """Remember that this file's schema is current (not for :memory:)"""
+        if self.db_file != ":memory:":
+            self._initialized_files.add(self.db_file)
+    
+    def _mark_writer_thread(self):
+        """Flag the executor thread as the single writer"""
+        self._local.is_writer = True
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's persistent connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.db_file == ":memory:" and self._memory_conn is not None:
+                # Every connection to :memory: is a separate database, so share one
+                conn = self._memory_conn
+            else:
+                conn = sqlite3.connect(
+                    self.db_file,
+                    check_same_thread=False,
+                    isolation_level=None,
+                    cached_statements=256
+                )
+                self._configure(conn)
+                if self.db_file == ":memory:":
+                    self._memory_conn = conn
+            self._local.conn = conn
+        return conn
     
     @contextmanager
     def get_connection(self):
         """Context manager for database connections"""
-        conn = None
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_file)
-            conn.row_factory = sqlite3.Row
             yield conn
         except Exception as e:
-            if conn:
+            if conn.in_transaction:
                 conn.rollback()
             logger.error(f"Database error: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
     
+    @contextmanager
+    def transaction(self):
+        """Context manager wrapping writes in BEGIN IMMEDIATE/COMMIT"""
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+    
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
+    def _configure(self, conn: sqlite3.Connection):
+        """Apply connection tuning PRAGMAs"""
+        if self.db_file != ":memory:" and self.db_file not in Database._wal_files:
+            conn.execute("PRAGMA journal_mode=WAL")
+            Database._wal_files.add(self.db_file)
+        
+        # Per-connection settings
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA busy_timeout=3000")
+    
+    @_single_writer
     def add_or_update_user(self, user_id: int, username: str = None, 
                           first_name: str = None, last_name: str = None):
         """Add or update user information"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO users 
-                    (user_id, username, first_name, last_name, last_active)
-                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (user_id, username, first_name, last_name))
-                conn.commit()
+            with self.transaction() as conn:
+                conn.execute(_SQL_REPLACE_USER, (user_id, username, first_name, last_name))
         except Exception as e:
             logger.error(f"Failed to add/update user {user_id}: {e}")
     
     def add_search_history(self, user_id: int, query: str, results_count: int = 0):
-        """Add search to history"""
+        """Queue a search for the history table, flushing in batches"""
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        with self._pending_lock:
+            if not self._pending_history:
+                self._pending_since = time.monotonic()
+            self._pending_history.append((user_id, query, results_count, timestamp))
+            due = (
+                len(self._pending_history) >= self.HISTORY_FLUSH_SIZE or
+                time.monotonic() - self._pending_since >= self.HISTORY_FLUSH_INTERVAL
+            )
+        
+        if due:
+            self.flush_search_history()
+    
+    def flush_search_history(self):
+        """Write all queued searches in one transaction"""
+        with self._pending_lock:
+            pending, self._pending_history = self._pending_history, []
+        
+        if pending:
+            self.add_search_history_many(pending)
+    
+    @_single_writer
+    def add_search_history_many(self, entries: List[Tuple[int, str, int, str]]):
+        """Insert (user_id, query, results_count, timestamp) rows in one transaction"""
+        counts = Counter(entry[0] for entry in entries)
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO search_history (user_id, query, results_count)
-                    VALUES (?, ?, ?)
-                ''', (user_id, query, results_count))
+            with self.transaction() as conn:
+                conn.executemany(_SQL_INSERT_HISTORY, entries)
                 
-                # Keep only last 20 searches per user
-                cursor.execute('''
-                    DELETE FROM search_history 
-                    WHERE user_id = ? AND id NOT IN (
-                        SELECT id FROM search_history 
-                        WHERE user_id = ? 
-                        ORDER BY timestamp DESC 
-                        LIMIT 20
-                    )
-                ''', (user_id, user_id))
-                
-                conn.commit()
+                # Trim to the last MAX_HISTORY searches every few inserts
+                trimmed = set()
+                for user_id, count in counts.items():
+                    if self._writes_since_trim.get(user_id, 0) + count >= self.HISTORY_TRIM_INTERVAL:
+                        conn.execute(_SQL_TRIM_HISTORY, (user_id, user_id, self.MAX_HISTORY - 1))
+                        trimmed.add(user_id)
+            
+            # Only count writes once they are committed, so a rolled-back batch
+            # doesn't push a user's next trim further away
+            for user_id, count in counts.items():
+                if user_id in trimmed:
+                    self._writes_since_trim.pop(user_id, None)
+                else:
+                    self._writes_since_trim[user_id] = self._writes_since_trim.get(user_id, 0) + count
+                self._history_cache.invalidate(user_id)
         except Exception as e:
-            logger.error(f"Failed to add search history for user {user_id}: {e}")
+            logger.error(f"Failed to add {len(entries)} search history entries: {e}")
     
     def get_search_history(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Get user's search history"""
+        self.flush_search_history()
+        cached = self._history_cache.get(user_id)
+        if cached is not None:
+            return cached[:limit]
+        
+        version = self._history_cache.version(user_id)
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT query, results_count, timestamp 
-                    FROM search_history 
-                    WHERE user_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (user_id, limit))
+                # Cache the whole (trimmed) history once and slice per caller
+                cursor = conn.execute(_SQL_GET_HISTORY, (user_id, max(limit, self.MAX_HISTORY)))
+                cursor.row_factory = sqlite3.Row
                 
-                return [dict(row) for row in cursor.fetchall()]
+                history = list(map(dict, cursor.fetchall()))
+                self._history_cache.set_if_unchanged(user_id, history, version)
+                return history[:limit]
         except Exception as e:
             logger.error(f"Failed to get search history for user {user_id}: {e}")
             return []
     
+    @_single_writer
     def add_favorite(self, user_id: int, title: str, url: str, platform: str = None):
         """Add link to favorites"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Check if already exists
-                cursor.execute('''
-                    SELECT id FROM favorites 
-                    WHERE user_id = ? AND url = ?
-                ''', (user_id, url))
-                
-                if cursor.fetchone():
-                    return False  # Already in favorites
-                
-                cursor.execute('''
-                    INSERT INTO favorites (user_id, title, url, platform)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, title, url, platform))
-                
-                conn.commit()
-                return True
+            with self.transaction() as conn:
+                cursor = conn.execute(_SQL_INSERT_FAVORITE, (user_id, title, url, platform))
+            
+            self._favorites_cache.invalidate(user_id)
+            # Ignored when the URL is already in favorites
+            return cursor.rowcount == 1
         except Exception as e:
             logger.error(f"Failed to add favorite for user {user_id}: {e}")
             return False
     
+    @_single_writer
+    def add_favorites_many(self, user_id: int, favorites: List[Dict]) -> int:
+        """Add several links to favorites in one transaction, returning how many were new"""
+        try:
+            with self.transaction() as conn:
+                before = conn.total_changes
+                conn.executemany(_SQL_INSERT_FAVORITE, [
+                    (user_id, fav.get('title', 'Untitled'), fav.get('url', ''), fav.get('platform'))
+                    for fav in favorites
+                ])
+                added = conn.total_changes - before
+            
+            self._favorites_cache.invalidate(user_id)
+            return added
+        except Exception as e:
+            logger.error(f"Failed to add favorites for user {user_id}: {e}")
+            return 0
+    
+    def favorites_version(self, user_id: int) -> int:
+        """Stamp that changes whenever the user's favorites change"""
+        return self._favorites_cache.version(user_id)
+    
     def get_favorites(self, user_id: int) -> List[Dict]:
         """Get user's favorites"""
+        cached = self._favorites_cache.get(user_id)
+        if cached is not None:
+            return list(cached)
+        
+        version = self._favorites_cache.version(user_id)
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT title, url, platform, added_at 
-                    FROM favorites 
-                    WHERE user_id = ? 
-                    ORDER BY added_at DESC
-                ''', (user_id,))
+                cursor = conn.execute(_SQL_GET_FAVORITES, (user_id,))
+                cursor.row_factory = sqlite3.Row
                 
-                return [dict(row) for row in cursor.fetchall()]
+                favorites = list(map(dict, cursor.fetchall()))
+                self._favorites_cache.set_if_unchanged(user_id, favorites, version)
+                return list(favorites)
         except Exception as e:
             logger.error(f"Failed to get favorites for user {user_id}: {e}")
             return []
     
+    @_single_writer
     def remove_favorite(self, user_id: int, url: str) -> bool:
         """Remove link from favorites"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    DELETE FROM favorites 
-                    WHERE user_id = ? AND url = ?
-                ''', (user_id, url))
-                
-                conn.commit()
-                return cursor.rowcount > 0
+            with self.transaction() as conn:
+                cursor = conn.execute(_SQL_DELETE_FAVORITE, (user_id, url))
+            
+            self._favorites_cache.invalidate(user_id)
+            return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"Failed to remove favorite for user {user_id}: {e}")
             return False
     
-    def check_rate_limit(self, user_id: int, limit: int = 10, window: int = 60) -> bool:
-        """Check if user has exceeded rate limit"""
+    def get_user_stats(self, user_id: int, limit: int = 10) -> Tuple[int, int, int]:
+        """Get (searches, total results found, favorites) counts over the user's latest searches"""
+        self.flush_search_history()
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Clean old entries
-                cursor.execute('''
-                    DELETE FROM rate_limits 
-                    WHERE window_start < datetime('now', '-' || ? || ' seconds')
-                ''', (window,))
-                
-                # Get current count
-                cursor.execute('''
-                    SELECT search_count FROM rate_limits 
-                    WHERE user_id = ?
-                ''', (user_id,))
-                
-                row = cursor.fetchone()
-                if not row:
-                    # First search in window
-                    cursor.execute('''
-                        INSERT INTO rate_limits (user_id, search_count)
-                        VALUES (?, 1)
-                    ''', (user_id,))
-                    conn.commit()
-                    return True
-                
-                if row[0] >= limit:
-                    return False  # Rate limit exceeded
-                
-                # Increment count
-                cursor.execute('''
-                    UPDATE rate_limits 
-                    SET search_count = search_count + 1 
-                    WHERE user_id = ?
-                ''', (user_id,))
-                
-                conn.commit()
-                return True
-                
+                return conn.execute(_SQL_GET_USER_STATS, (user_id, user_id, limit)).fetchone()
         except Exception as e:
-            logger.error(f"Rate limit check failed for user {user_id}: {e}")
-            return True  # Allow on error
+            logger.error(f"Failed to get stats for user {user_id}: {e}")
+            return 0, 0, 0
     
     def get_user_settings(self, user_id: int) -> Dict:
         """Get user settings"""
+        cached = self._settings_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+        
+        version = self._settings_cache.version(user_id)
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT settings FROM users WHERE user_id = ?
-                ''', (user_id,))
-                
-                row = cursor.fetchone()
-                if row and row[0]:
-                    return json.loads(row[0])
-                return {}
+                settings = dict(conn.execute(_SQL_GET_SETTINGS, (user_id,)).fetchall())
+                self._settings_cache.set_if_unchanged(user_id, settings, version)
+                return dict(settings)
         except Exception as e:
             logger.error(f"Failed to get settings for user {user_id}: {e}")
             return {}
     
+    @_single_writer
     def update_user_settings(self, user_id: int, settings: Dict):
-        """Update user settings"""
+        """Update user settings, writing only the keys that changed"""
+        previous = self.get_user_settings(user_id)
+        changed = [
+            (user_id, key, value) for key, value in settings.items()
+            if key not in previous or previous[key] != value
+        ]
+        removed = [(user_id, key) for key in previous if key not in settings]
+        
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE users SET settings = ? WHERE user_id = ?
-                ''', (json.dumps(settings), user_id))
-                conn.commit()
+            with self.transaction() as conn:
+                if changed:
+                    conn.executemany(_SQL_SET_SETTING, changed)
+                if removed:
+                    conn.executemany(_SQL_DELETE_SETTING, removed)
+            
+            # Write-through so the next read skips the query; invalidating first
+            # rejects any read that fetched the old rows before this commit
+            self._settings_cache.invalidate(user_id)
+            self._settings_cache.set(user_id, dict(settings))
         except Exception as e:
             logger.error(f"Failed to update settings for user {user_id}: {e}")
@@ -4,7 +4,9 @@ Contains all command and callback handlers with improved functionality
 """
 
 import asyncio
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest, NetworkError
@@ -14,6 +16,7 @@ from bot.database import Database
 from bot.search import SearchEngine, SearchProgress
 from bot.keyboards import BotKeyboards
 from bot.utils import MessageFormatter, Validator, RateLimiter
+from bot.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -26,9 +29,87 @@ formatter = MessageFormatter()
 validator = Validator()
 rate_limiter = RateLimiter()
 
-# Store current search results in memory (in production, use Redis)
-user_search_results = {}
-user_search_states = {}
+# Blocking database work runs on its own bounded pool, away from the loop's
+# default executor (which asyncio also uses for DNS lookups)
+_db_pool = ThreadPoolExecutor(
+    max_workers=config.DB_THREAD_POOL_SIZE,
+    thread_name_prefix="db-call"
+)
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking Database call on the database worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_pool, functools.partial(fn, *args, **kwargs))
+
+# The help text never changes, so build it once
+_HELP_TEXT = formatter.format_help_message()
+
+# Current search results and search mode per user, dropped once stale
+user_search_results = TTLCache(config.SEARCH_RESULT_TTL, config.CACHE_MAXSIZE)
+user_search_states = TTLCache(config.SEARCH_STATE_TTL, config.CACHE_MAXSIZE)
+
+# Background search tasks, referenced until done so they are not garbage collected
+_pending = set()
+
+# Per callback message, a hash of the (text, keyboard) it currently shows. Telegram
+# rejects an identical edit with "message is not modified", so those are skipped
+_last_renders = TTLCache(config.SEARCH_RESULT_TTL, config.CACHE_MAXSIZE)
+
+async def _edit_if_changed(query, text: str, reply_markup=None, **kwargs):
+    """Edit the callback's message unless it already shows this text and keyboard"""
+    message = query.message
+    key = (message.chat_id, message.message_id) if message else query.inline_message_id
+    render = hash((text, reply_markup))
+    if _last_renders.get(key) == render:
+        return
+    
+    await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    _last_renders.set(key, render)
+
+# Rendered favorites pages keyed by (user_id, page, favorites version); a write
+# moves the user to a new version, and a page is only cached if no write
+# landed while it was being fetched, so stale pages are never served
+_favorites_pages = TTLCache(config.SEARCH_RESULT_TTL, config.CACHE_MAXSIZE)
+
+async def _render_favorites_page(user_id: int, page: int = 0):
+    """Return the (text, keyboard) for a page of the user's favorites"""
+    version = db.favorites_version(user_id)
+    key = (user_id, page, version)
+    rendered = _favorites_pages.get(key)
+    if rendered is None:
+        favorites = await run_db(db.get_favorites, user_id)
+        rendered = (
+            formatter.format_favorites_list(favorites, page),
+            keyboards.favorites_menu(favorites, page)
+        )
+        if db.favorites_version(user_id) == version:
+            _favorites_pages.set(key, rendered)
+    return rendered
+
+def _store_search_results(user_id: int, query: str, results: list, total_found: int) -> dict:
+    """Remember a user's latest results for pagination and result callbacks"""
+    search_data = {
+        'query': query,
+        'results': results,
+        'total_found': total_found,
+        'current_page': 0,
+        'pages': {}  # page -> (text, keyboard), rendered on first view
+    }
+    user_search_results.set(user_id, search_data)
+    return search_data
+
+def _render_results_page(search_data: dict, page: int):
+    """Return the (text, keyboard) for a results page, rendering it once per search"""
+    rendered = search_data['pages'].get(page)
+    if rendered is None:
+        rendered = (
+            formatter.format_search_results(
+                search_data['results'], search_data['query'], page, search_data['total_found']
+            ),
+            keyboards.search_results(search_data['results'], page, 1)
+        )
+        search_data['pages'][page] = rendered
+    return rendered
 
 async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Enhanced start command handler"""
@@ -36,7 +117,8 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         
         # Add/update user in database
-        db.add_or_update_user(
+        await run_db(
+            db.add_or_update_user,
             user_id=user.id,
             username=user.username,
             first_name=user.first_name,
@@ -48,7 +130,7 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(
             welcome_text,
-            reply_markup=keyboards.main_menu(),
+            reply_markup=keyboards.main_menu_json(),
             parse_mode='Markdown'
         )
         
@@ -58,17 +140,15 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Start handler error: {e}")
         await update.message.reply_text(
             "Welcome! I'm your enhanced course finder bot. Use /help for assistance.",
-            reply_markup=keyboards.main_menu()
+            reply_markup=keyboards.main_menu_json()
         )
 
 async def help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Enhanced help command handler"""
     try:
-        help_text = formatter.format_help_message()
-        
         await update.message.reply_text(
-            help_text,
-            reply_markup=keyboards.back_button(),
+            _HELP_TEXT,
+            reply_markup=keyboards.back_button_json(),
             parse_mode='Markdown'
         )
         
@@ -100,25 +180,35 @@ async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # Also check database rate limiting
-        if not db.check_rate_limit(user_id):
-            await update.message.reply_text(
-                formatter.format_error_message("rate_limit"),
-                parse_mode='Markdown'
-            )
-            return
-        
         # Send initial progress message
         progress_msg = await update.message.reply_text(
             "🔍 Starting search...",
-            reply_markup=keyboards.progress_indicator()
+            reply_markup=keyboards.progress_indicator_json()
+        )
+        
+        # Run the search in the background so other updates keep flowing
+        task = context.application.create_task(
+            _run_search(user_id, query, progress_msg),
+            update=update
         )
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
         
+    except Exception as e:
+        logger.error(f"Search handler error: {e}")
+        await update.message.reply_text(
+            formatter.format_error_message("api_error"),
+            parse_mode='Markdown'
+        )
+
+async def _run_search(user_id: int, query: str, progress_msg):
+    """Search, store the results and replace the progress message with them"""
+    try:
         # Create progress tracker
         progress = SearchProgress(progress_msg, config)
         
         # Get user settings
-        user_settings = db.get_user_settings(user_id)
+        user_settings = await run_db(db.get_user_settings, user_id)
         max_results = user_settings.get('results_per_page', config.MAX_RESULTS_PER_PAGE)
         
         # Perform search
@@ -129,165 +219,163 @@ async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 progress_callback=progress.update
             )
             
-            progress.stop()
+            await progress.stop()
             
             # Store results for pagination and callbacks
-            user_search_results[user_id] = {
-                'query': query,
-                'results': results,
-                'total_found': total_found,
-                'current_page': 0
-            }
+            search_data = _store_search_results(user_id, query, results, total_found)
             
             # Add to search history
-            db.add_search_history(user_id, query, len(results))
+            await run_db(db.add_search_history, user_id, query, len(results))
             
             # Format and send results
             if results:
-                results_text = formatter.format_search_results(
-                    results, query, 0, total_found
-                )
+                results_text, results_keyboard = _render_results_page(search_data, 0)
                 
                 await progress_msg.edit_text(
                     results_text,
-                    reply_markup=keyboards.search_results(results, 0, 1),
+                    reply_markup=results_keyboard,
                     parse_mode='Markdown'
                 )
             else:
                 await progress_msg.edit_text(
                     formatter.format_error_message("no_results"),
-                    reply_markup=keyboards.search_options(),
+                    reply_markup=keyboards.search_options_json(),
                     parse_mode='Markdown'
                 )
             
         except Exception as search_error:
-            progress.stop()
+            await progress.stop()
             logger.error(f"Search error for user {user_id}: {search_error}")
             
             await progress_msg.edit_text(
                 formatter.format_error_message("search_failed", str(search_error)),
-                reply_markup=keyboards.search_options(),
+                reply_markup=keyboards.search_options_json(),
                 parse_mode='Markdown'
             )
-        
+    
     except Exception as e:
-        logger.error(f"Search handler error: {e}")
-        await update.message.reply_text(
-            formatter.format_error_message("api_error"),
-            parse_mode='Markdown'
-        )
+        logger.error(f"Search task error for user {user_id}: {e}")
 
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Enhanced callback query handler for inline keyboards"""
+    query = update.callback_query
+    answer = None
+    
     try:
-        query = update.callback_query
-        await query.answer()
-        
         user_id = update.effective_user.id
         data = query.data
         
-        # Route to appropriate handler based on callback data
-        if data.startswith("action_"):
-            await handle_action_callbacks(query, user_id, data)
-        elif data.startswith("search_"):
-            await handle_search_callbacks(query, user_id, data)
-        elif data.startswith("result_"):
-            await handle_result_callbacks(query, user_id, data)
-        elif data.startswith("fav_"):
-            await handle_favorite_callbacks(query, user_id, data)
-        elif data.startswith("history_"):
-            await handle_history_callbacks(query, user_id, data)
-        elif data.startswith("setting_"):
-            await handle_setting_callbacks(query, user_id, data)
-        elif data.startswith("back_"):
-            await handle_back_callbacks(query, user_id, data)
-        elif data.startswith("page_"):
-            await handle_pagination_callbacks(query, user_id, data)
-        elif data.startswith("cancel_"):
-            await query.edit_message_text(
+        # Route on the text before the first "_"; handlers get the rest
+        prefix, _, rest = data.partition("_")
+        
+        # Telegram takes one answer per query. Routes with a toast send it
+        # alongside their edit; every other press is acknowledged right away,
+        # so slow routes (a history re-run searches) don't leave it spinning
+        if not _answers_itself(prefix, rest):
+            answer = asyncio.ensure_future(query.answer())
+        
+        route = _ROUTES.get(prefix)
+        if route:
+            await route(query, user_id, rest)
+        elif prefix == "cancel":
+            await _edit_if_changed(
+                query,
                 "Operation cancelled. Use the menu to continue.",
-                reply_markup=keyboards.main_menu()
+                reply_markup=keyboards.main_menu_json()
             )
-        elif data.startswith("confirm_"):
+        elif prefix == "confirm":
             # Handle confirmations
-            await query.edit_message_text(
+            await _edit_if_changed(
+                query,
                 "Action confirmed. Processing...",
-                reply_markup=keyboards.main_menu()
+                reply_markup=keyboards.main_menu_json()
             )
         else:
-            await query.edit_message_text(
+            await _edit_if_changed(
+                query,
                 "Please use the menu buttons to navigate.",
-                reply_markup=keyboards.main_menu()
+                reply_markup=keyboards.main_menu_json()
             )
         
     except BadRequest as e:
         logger.warning(f"Bad request in callback handler: {e}")
+        if answer is None:
+            answer = asyncio.ensure_future(query.answer())
     except Exception as e:
         logger.error(f"Callback handler error: {e}")
+        if answer is None:
+            answer = asyncio.ensure_future(query.answer())
         try:
-            await query.edit_message_text(
+            await _edit_if_changed(
+                query,
                 "⚠️ An error occurred. Please try again.",
-                reply_markup=keyboards.main_menu()
+                reply_markup=keyboards.main_menu_json()
             )
         except:
             pass
+    finally:
+        if answer is not None:
+            try:
+                await answer
+            except Exception as e:
+                logger.warning(f"Could not answer callback query: {e}")
 
-async def handle_action_callbacks(query, user_id: int, data: str):
+async def handle_action_callbacks(query, user_id: int, action: str):
     """Handle main action callbacks"""
-    action = data.replace("action_", "")
     
     if action == "search":
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             "🔍 **Search Options**\n\nChoose your preferred search method:",
-            reply_markup=keyboards.search_options(),
+            reply_markup=keyboards.search_options_json(),
             parse_mode='Markdown'
         )
     
     elif action == "favorites":
-        favorites = db.get_favorites(user_id)
-        favorites_text = formatter.format_favorites_list(favorites)
+        favorites_text, favorites_keyboard = await _render_favorites_page(user_id)
         
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             favorites_text,
-            reply_markup=keyboards.favorites_menu(favorites),
+            reply_markup=favorites_keyboard,
             parse_mode='Markdown'
         )
     
     elif action == "history":
-        history = db.get_search_history(user_id)
+        history = await run_db(db.get_search_history, user_id)
         history_text = formatter.format_search_history(history)
         
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             history_text,
             reply_markup=keyboards.history_menu(history),
             parse_mode='Markdown'
         )
     
     elif action == "settings":
-        settings = db.get_user_settings(user_id)
+        settings = await run_db(db.get_user_settings, user_id)
         settings_text = formatter.format_settings_display(settings)
         
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             settings_text,
             reply_markup=keyboards.settings_menu(settings),
             parse_mode='Markdown'
         )
     
     elif action == "help":
-        help_text = formatter.format_help_message()
-        
-        await query.edit_message_text(
-            help_text,
-            reply_markup=keyboards.back_button(),
+        await _edit_if_changed(
+            query,
+            _HELP_TEXT,
+            reply_markup=keyboards.back_button_json(),
             parse_mode='Markdown'
         )
     
     elif action == "stats":
         await show_user_stats(query, user_id)
 
-async def handle_search_callbacks(query, user_id: int, data: str):
+async def handle_search_callbacks(query, user_id: int, search_type: str):
     """Handle search-related callbacks"""
-    search_type = data.replace("search_", "")
     
     instructions = {
         "quick": "Type any course name to start a quick search across all platforms.",
@@ -301,42 +389,42 @@ async def handle_search_callbacks(query, user_id: int, data: str):
     instruction = instructions.get(search_type, "Type your course name to search.")
     
     # Store search preference
-    user_search_states[user_id] = {
+    user_search_states.set(user_id, {
         'type': search_type,
         'waiting_for_query': True
-    }
+    })
     
-    await query.edit_message_text(
+    await _edit_if_changed(
+        query,
         f"🔍 **{search_type.title()} Search**\n\n{instruction}",
-        reply_markup=keyboards.back_button(),
+        reply_markup=keyboards.back_button_json(),
         parse_mode='Markdown'
     )
 
 async def handle_result_callbacks(query, user_id: int, data: str):
     """Handle result-related callbacks"""
-    if user_id not in user_search_results:
-        await query.edit_message_text(
+    search_data = user_search_results.get(user_id)
+    if search_data is None:
+        await _edit_if_changed(
+            query,
             "No search results available. Please perform a new search.",
-            reply_markup=keyboards.main_menu()
+            reply_markup=keyboards.main_menu_json()
         )
         return
     
-    action_parts = data.split("_")
-    if len(action_parts) < 2:
-        return
-    
-    action = action_parts[1]
+    action = data.partition("_")[0]
     
     if action.isdigit():
         # Show result details
         result_index = int(action)
-        results = user_search_results[user_id]['results']
+        results = search_data['results']
         
         if 0 <= result_index < len(results):
             result = results[result_index]
             details_text = formatter.format_result_details(result, result_index)
             
-            await query.edit_message_text(
+            await _edit_if_changed(
+                query,
                 details_text,
                 reply_markup=keyboards.result_details(result_index),
                 parse_mode='Markdown'
@@ -344,76 +432,83 @@ async def handle_result_callbacks(query, user_id: int, data: str):
 
 async def handle_favorite_callbacks(query, user_id: int, data: str):
     """Handle favorite-related callbacks"""
-    action_parts = data.split("_", 2)
-    if len(action_parts) < 2:
-        return
-    
-    action = action_parts[1]
+    action, _, rest = data.partition("_")
+    search_data = user_search_results.get(user_id)
     
-    if action.isdigit() and user_id in user_search_results:
-        # Add to favorites from search results
+    if action.isdigit():
+        # Add to favorites from search results (answers the query itself)
         result_index = int(action)
-        results = user_search_results[user_id]['results']
+        results = search_data['results'] if search_data is not None else []
+        toast = None
         
-        if 0 <= result_index < len(results):
+        if result_index < len(results):
             result = results[result_index]
             
-            success = db.add_favorite(
+            success = await run_db(
+                db.add_favorite,
                 user_id=user_id,
-                title=result.get('title', 'Untitled'),
-                url=result.get('link', ''),
-                platform=result.get('platform', 'Unknown')
+                title=result.title or 'Untitled',
+                url=result.link,
+                platform=result.platform
             )
             
-            if success:
-                await query.answer("⭐ Added to favorites!")
-            else:
-                await query.answer("Already in favorites!")
+            toast = "⭐ Added to favorites!" if success else "Already in favorites!"
+        
+        await query.answer(toast)
     
-    elif action == "add" and len(action_parts) > 2:
+    elif action == "add" and rest.isdigit():
         # Add specific result to favorites
-        result_index = int(action_parts[2])
+        result_index = int(rest)
         # Implementation similar to above
         pass
     
+    elif action == "page" and rest.isdigit():
+        favorites_text, favorites_keyboard = await _render_favorites_page(user_id, int(rest))
+        
+        await _edit_if_changed(
+            query,
+            favorites_text,
+            reply_markup=favorites_keyboard,
+            parse_mode='Markdown'
+        )
+    
     elif action == "clear":
         # Show confirmation dialog
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             "🗑️ **Clear All Favorites**\n\nAre you sure you want to remove all saved favorites? This action cannot be undone.",
             reply_markup=keyboards.confirmation_dialog("clear_favorites"),
             parse_mode='Markdown'
         )
     
     elif action == "export":
-        favorites = db.get_favorites(user_id)
+        favorites = await run_db(db.get_favorites, user_id)
         export_text = formatter.export_favorites_text(favorites)
         
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             f"📤 **Favorites Export**\n\n```\n{export_text}\n```",
-            reply_markup=keyboards.back_button(),
+            reply_markup=keyboards.back_button_json(),
             parse_mode='Markdown'
         )
 
 async def handle_history_callbacks(query, user_id: int, data: str):
     """Handle history-related callbacks"""
-    action_parts = data.split("_", 2)
-    if len(action_parts) < 2:
-        return
-    
-    action = action_parts[1]
+    action, _, rest = data.partition("_")
     
-    if action == "search" and len(action_parts) > 2:
+    if action == "search" and rest.isdigit():
         # Re-run search from history
-        search_index = int(action_parts[2])
-        history = db.get_search_history(user_id)
+        search_index = int(rest)
+        history = await run_db(db.get_search_history, user_id)
         
         if 0 <= search_index < len(history):
             search_query = history[search_index]['query']
             
             # Simulate a new search message
-            await query.edit_message_text(
+            await _edit_if_changed(
+                query,
                 f"🔍 Re-running search: \"{search_query}\"",
-                reply_markup=keyboards.progress_indicator()
+                reply_markup=keyboards.progress_indicator_json()
             )
             
             # Perform the search (similar to search_handler)
@@ -423,161 +518,169 @@ async def handle_history_callbacks(query, user_id: int, data: str):
                     max_results=config.MAX_RESULTS_PER_PAGE
                 )
                 
-                user_search_results[user_id] = {
-                    'query': search_query,
-                    'results': results,
-                    'total_found': total_found,
-                    'current_page': 0
-                }
+                search_data = _store_search_results(user_id, search_query, results, total_found)
                 
-                db.add_search_history(user_id, search_query, len(results))
+                await run_db(db.add_search_history, user_id, search_query, len(results))
                 
                 if results:
-                    results_text = formatter.format_search_results(
-                        results, search_query, 0, total_found
-                    )
+                    results_text, results_keyboard = _render_results_page(search_data, 0)
                     
-                    await query.edit_message_text(
+                    await _edit_if_changed(
+                        query,
                         results_text,
-                        reply_markup=keyboards.search_results(results, 0, 1),
+                        reply_markup=results_keyboard,
                         parse_mode='Markdown'
                     )
                 else:
-                    await query.edit_message_text(
+                    await _edit_if_changed(
+                        query,
                         formatter.format_error_message("no_results"),
-                        reply_markup=keyboards.search_options(),
+                        reply_markup=keyboards.search_options_json(),
                         parse_mode='Markdown'
                     )
                     
             except Exception as e:
-                await query.edit_message_text(
+                await _edit_if_changed(
+                    query,
                     formatter.format_error_message("search_failed"),
-                    reply_markup=keyboards.main_menu(),
+                    reply_markup=keyboards.main_menu_json(),
                     parse_mode='Markdown'
                 )
     
     elif action == "clear":
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             "🗑️ **Clear Search History**\n\nAre you sure you want to clear your search history? This action cannot be undone.",
             reply_markup=keyboards.confirmation_dialog("clear_history"),
             parse_mode='Markdown'
         )
 
-async def handle_setting_callbacks(query, user_id: int, data: str):
+async def handle_setting_callbacks(query, user_id: int, setting: str):
     """Handle settings callbacks"""
-    setting = data.replace("setting_", "")
-    current_settings = db.get_user_settings(user_id)
+    current_settings = await run_db(db.get_user_settings, user_id)
     
     if setting == "results_per_page":
         current_value = current_settings.get('results_per_page', 5)
         new_value = (current_value % 10) + 3  # Cycle between 3-10
         
         current_settings['results_per_page'] = new_value
-        db.update_user_settings(user_id, current_settings)
-        
-        await query.answer(f"Results per page set to {new_value}")
+        await run_db(db.update_user_settings, user_id, current_settings)
         
-        # Refresh settings display
+        # Refresh settings display alongside the toast
         settings_text = formatter.format_settings_display(current_settings)
-        await query.edit_message_text(
-            settings_text,
-            reply_markup=keyboards.settings_menu(current_settings),
-            parse_mode='Markdown'
+        await asyncio.gather(
+            query.answer(f"Results per page set to {new_value}"),
+            _edit_if_changed(
+                query,
+                settings_text,
+                reply_markup=keyboards.settings_menu(current_settings),
+                parse_mode='Markdown'
+            )
         )
     
     elif setting == "notifications":
         current_value = current_settings.get('notifications', True)
         current_settings['notifications'] = not current_value
-        db.update_user_settings(user_id, current_settings)
+        await run_db(db.update_user_settings, user_id, current_settings)
         
         status = "enabled" if not current_value else "disabled"
-        await query.answer(f"Notifications {status}")
-        
-        # Refresh settings display
+        # Refresh settings display alongside the toast
         settings_text = formatter.format_settings_display(current_settings)
-        await query.edit_message_text(
-            settings_text,
-            reply_markup=keyboards.settings_menu(current_settings),
-            parse_mode='Markdown'
+        await asyncio.gather(
+            query.answer(f"Notifications {status}"),
+            _edit_if_changed(
+                query,
+                settings_text,
+                reply_markup=keyboards.settings_menu(current_settings),
+                parse_mode='Markdown'
+            )
         )
 
-async def handle_back_callbacks(query, user_id: int, data: str):
+async def handle_back_callbacks(query, user_id: int, destination: str):
     """Handle back navigation callbacks"""
-    destination = data.replace("back_", "")
+    search_data = user_search_results.get(user_id)
     
     if destination == "main":
+        # The callback carries the user, so no lookup is needed for the name
+        user = query.from_user
         welcome_text = formatter.format_welcome_message(
-            update.effective_user.first_name or "there"
+            user.first_name or user.username or "there"
         )
         
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             welcome_text,
-            reply_markup=keyboards.main_menu(),
+            reply_markup=keyboards.main_menu_json(),
             parse_mode='Markdown'
         )
     
-    elif destination == "results" and user_id in user_search_results:
-        search_data = user_search_results[user_id]
-        results_text = formatter.format_search_results(
-            search_data['results'], 
-            search_data['query'], 
-            search_data['current_page'],
-            search_data['total_found']
+    elif destination == "results" and search_data is not None:
+        results_text, results_keyboard = _render_results_page(
+            search_data, search_data['current_page']
         )
         
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             results_text,
-            reply_markup=keyboards.search_results(
-                search_data['results'], 
-                search_data['current_page'], 
-                1
-            ),
+            reply_markup=results_keyboard,
             parse_mode='Markdown'
         )
 
-async def handle_pagination_callbacks(query, user_id: int, data: str):
+async def handle_pagination_callbacks(query, user_id: int, page_str: str):
     """Handle pagination callbacks"""
-    if user_id not in user_search_results:
+    search_data = user_search_results.get(user_id)
+    if search_data is None:
         await query.answer("No search results available")
         return
     
-    page_str = data.replace("page_", "")
     if not page_str.isdigit():
+        await query.answer()
         return
     
     new_page = int(page_str)
-    search_data = user_search_results[user_id]
     search_data['current_page'] = new_page
     
     # Update display
-    results_text = formatter.format_search_results(
-        search_data['results'],
-        search_data['query'],
-        new_page,
-        search_data['total_found']
-    )
+    results_text, results_keyboard = _render_results_page(search_data, new_page)
     
-    await query.edit_message_text(
-        results_text,
-        reply_markup=keyboards.search_results(
-            search_data['results'],
-            new_page,
-            1
-        ),
-        parse_mode='Markdown'
+    await asyncio.gather(
+        query.answer(),
+        _edit_if_changed(
+            query,
+            results_text,
+            reply_markup=results_keyboard,
+            parse_mode='Markdown'
+        )
     )
 
+def _answers_itself(prefix: str, rest: str) -> bool:
+    """Whether the route for this callback answers the query itself, to show a toast"""
+    return (
+        prefix == "page" or
+        (prefix == "fav" and rest.isdigit()) or
+        (prefix == "setting" and rest in ("results_per_page", "notifications"))
+    )
+
+# Callback data prefix (text before the first "_") -> handler
+_ROUTES = {
+    "action": handle_action_callbacks,
+    "search": handle_search_callbacks,
+    "result": handle_result_callbacks,
+    "fav": handle_favorite_callbacks,
+    "history": handle_history_callbacks,
+    "setting": handle_setting_callbacks,
+    "back": handle_back_callbacks,
+    "page": handle_pagination_callbacks
+}
+
 async def show_user_stats(query, user_id: int):
     """Show user statistics"""
     try:
-        history = db.get_search_history(user_id)
-        favorites = db.get_favorites(user_id)
-        
-        total_searches = len(history)
-        total_favorites = len(favorites)
+        total_searches, total_results_found, total_favorites = await run_db(
+            db.get_user_stats, user_id
+        )
         
         # Calculate some basic stats
-        total_results_found = sum(h.get('results_count', 0) for h in history)
         avg_results = total_results_found / max(total_searches, 1)
         
         stats_text = f"""
@@ -601,24 +704,26 @@ async def show_user_stats(query, user_id: int):
 Keep exploring and finding great courses! 🎓
 """
         
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             stats_text,
-            reply_markup=keyboards.back_button(),
+            reply_markup=keyboards.back_button_json(),
             parse_mode='Markdown'
         )
         
     except Exception as e:
         logger.error(f"Stats display error: {e}")
-        await query.edit_message_text(
+        await _edit_if_changed(
+            query,
             "📊 Statistics temporarily unavailable.",
-            reply_markup=keyboards.back_button()
+            reply_markup=keyboards.back_button_json()
         )
 
 # Additional handler functions for specific commands
 async def settings_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Settings command handler"""
     user_id = update.effective_user.id
-    settings = db.get_user_settings(user_id)
+    settings = await run_db(db.get_user_settings, user_id)
     settings_text = formatter.format_settings_display(settings)
     
     await update.message.reply_text(
@@ -630,7 +735,7 @@ async def settings_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """History command handler"""
     user_id = update.effective_user.id
-    history = db.get_search_history(user_id)
+    history = await run_db(db.get_search_history, user_id)
     history_text = formatter.format_search_history(history)
     
     await update.message.reply_text(
@@ -642,11 +747,10 @@ async def history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def favorites_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Favorites command handler"""
     user_id = update.effective_user.id
-    favorites = db.get_favorites(user_id)
-    favorites_text = formatter.format_favorites_list(favorites)
+    favorites_text, favorites_keyboard = await _render_favorites_page(user_id)
     
     await update.message.reply_text(
         favorites_text,
-        reply_markup=keyboards.favorites_menu(favorites),
+        reply_markup=favorites_keyboard,
         parse_mode='Markdown'
     )
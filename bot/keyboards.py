@@ -3,13 +3,25 @@ Inline keyboard layouts for enhanced user interaction
 Provides various keyboard configurations for different bot features
 """
 
+import functools
+import json
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from typing import List, Dict, Any
 
+from bot.config import Config
+from bot.search import SearchResult
+
 class BotKeyboards:
-    """Class containing all inline keyboard layouts"""
+    """Class containing all inline keyboard layouts
+    
+    Layouts that don't depend on user data are built once and shared; PTB
+    markups are immutable, so the same object can be sent any number of times.
+    """
+    
+    __slots__ = ()
     
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def main_menu() -> InlineKeyboardMarkup:
         """Main menu keyboard"""
         keyboard = [
@@ -29,6 +41,7 @@ class BotKeyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def search_options() -> InlineKeyboardMarkup:
         """Search options keyboard"""
         keyboard = [
@@ -51,22 +64,20 @@ class BotKeyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
-    def search_results(results: List[Dict], page: int = 0, total_pages: int = 1) -> InlineKeyboardMarkup:
+    def search_results(results: List[SearchResult], page: int = 0, total_pages: int = 1) -> InlineKeyboardMarkup:
         """Search results keyboard with pagination"""
-        keyboard = []
-        
         # Add result buttons (with index for identification)
-        for i, result in enumerate(results):
-            platform = BotKeyboards._get_platform_emoji(result.get('link', ''))
-            title = result.get('title', 'Untitled')[:40] + "..." if len(result.get('title', '')) > 40 else result.get('title', 'Untitled')
-            
-            keyboard.append([
+        keyboard = [
+            [
                 InlineKeyboardButton(
-                    f"{platform} {title}",
+                    f"{BotKeyboards._get_platform_emoji(result.link)} "
+                    f"{BotKeyboards._truncate(result.title or 'Untitled', 40)}",
                     callback_data=f"result_{i}"
                 ),
                 InlineKeyboardButton("⭐", callback_data=f"fav_{i}")
-            ])
+            ]
+            for i, result in enumerate(results)
+        ]
         
         # Pagination controls
         if total_pages > 1:
@@ -115,24 +126,19 @@ class BotKeyboards:
     @staticmethod
     def favorites_menu(favorites: List[Dict], page: int = 0) -> InlineKeyboardMarkup:
         """Favorites management keyboard"""
-        keyboard = []
-        
         # Show favorites (5 per page)
         start_idx = page * 5
-        end_idx = min(start_idx + 5, len(favorites))
-        
-        for i in range(start_idx, end_idx):
-            fav = favorites[i]
-            platform = BotKeyboards._get_platform_emoji(fav.get('url', ''))
-            title = fav.get('title', 'Untitled')[:35] + "..." if len(fav.get('title', '')) > 35 else fav.get('title', 'Untitled')
-            
-            keyboard.append([
+        keyboard = [
+            [
                 InlineKeyboardButton(
-                    f"{platform} {title}",
+                    f"{BotKeyboards._get_platform_emoji(fav.get('url', ''))} "
+                    f"{BotKeyboards._truncate(fav.get('title') or 'Untitled', 35)}",
                     callback_data=f"fav_open_{i}"
                 ),
                 InlineKeyboardButton("🗑️", callback_data=f"fav_del_{i}")
-            ])
+            ]
+            for i, fav in enumerate(favorites[start_idx:start_idx + 5], start_idx)
+        ]
         
         # Pagination for favorites
         total_pages = (len(favorites) + 4) // 5
@@ -168,7 +174,7 @@ class BotKeyboards:
         
         # Show recent searches
         for i, search in enumerate(history[:10]):
-            query = search.get('query', '')[:30] + "..." if len(search.get('query', '')) > 30 else search.get('query', '')
+            query = BotKeyboards._truncate(search.get('query') or '', 30)
             results_count = search.get('results_count', 0)
             
             keyboard.append([
@@ -230,6 +236,7 @@ class BotKeyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @functools.lru_cache(maxsize=128)
     def confirmation_dialog(action: str, item_id: str = "") -> InlineKeyboardMarkup:
         """Confirmation dialog keyboard"""
         keyboard = [
@@ -241,6 +248,7 @@ class BotKeyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def progress_indicator() -> InlineKeyboardMarkup:
         """Progress indicator keyboard"""
         keyboard = [
@@ -251,26 +259,54 @@ class BotKeyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    def _truncate(text: str, limit: int) -> str:
+        """Cut text to limit characters for a button label, marking the cut with ..."""
+        return text if len(text) <= limit else text[:limit] + "..."
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def _get_platform_emoji(url: str) -> str:
         """Get emoji for platform based on URL"""
-        url_lower = url.lower()
-        if "drive.google.com" in url_lower:
-            return "📁"
-        elif "mediafire.com" in url_lower:
-            return "💾"
-        elif "mega.nz" in url_lower:
-            return "☁️"
-        elif "dropbox.com" in url_lower:
-            return "📦"
-        elif "onedrive.live.com" in url_lower:
-            return "🌐"
-        else:
-            return "🔗"
+        domain = Config.match_platform(url)
+        return Config.PLATFORM_INFO[domain][1] if domain else "🔗"
     
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def back_button() -> InlineKeyboardMarkup:
         """Simple back button"""
         keyboard = [
             [InlineKeyboardButton("« Back", callback_data="back_main")]
         ]
         return InlineKeyboardMarkup(keyboard)
+    
+    # Pre-serialized static keyboards. PTB sends a str reply_markup as-is, so
+    # passing these skips the to_dict() walk and json.dumps() on every send.
+    
+    @staticmethod
+    def _to_json(markup: InlineKeyboardMarkup) -> str:
+        """Serialize a markup the way the Bot API expects it"""
+        return json.dumps(markup.to_dict(), separators=(",", ":"))
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def main_menu_json() -> str:
+        """Main menu keyboard as a JSON string"""
+        return BotKeyboards._to_json(BotKeyboards.main_menu())
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def search_options_json() -> str:
+        """Search options keyboard as a JSON string"""
+        return BotKeyboards._to_json(BotKeyboards.search_options())
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def progress_indicator_json() -> str:
+        """Progress indicator keyboard as a JSON string"""
+        return BotKeyboards._to_json(BotKeyboards.progress_indicator())
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def back_button_json() -> str:
+        """Back button as a JSON string"""
+        return BotKeyboards._to_json(BotKeyboards.back_button())
@@ -4,29 +4,99 @@ Handles course link searching with progress tracking and error handling
 """
 
 import asyncio
-import requests
+import json
+import time
+import httpx
 import logging
+from dataclasses import dataclass
+from operator import attrgetter
 from typing import List, Dict, Optional, Tuple
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, urlsplit, urlunsplit, parse_qsl, urlencode
 import re
 from datetime import datetime
 
 from bot.config import Config
+from bot.cache import TTLCache
+
+# orjson parses the SerpAPI payload several times faster when it is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+@dataclass(slots=True)
+class SearchResult:
+    """A processed search hit (slots keep cached result lists compact)"""
+    title: str
+    link: str
+    snippet: str
+    platform: str
+    file_info: Dict
+    quality_score: int
+    found_at: str
+    # Filled in by SearchEngine._filter_and_enhance_results
+    display_title: str = ""
+    platform_emoji: str = "🔗"
+    estimated_size: str = "Unknown size"
+
+# Platform display name -> emoji
+_PLATFORM_EMOJI = {name: emoji for name, emoji in Config.PLATFORM_INFO.values()}
+
+# File extension followed by whitespace, end of text or a URL delimiter
+_FILE_EXT_RE = re.compile(r'\.(zip|rar|7z|tar|gz|mp4|mkv|avi|pdf|epub|mobi)(?:\s|$|[?&#])', re.IGNORECASE)
+_SIZE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(MB|GB|TB)', re.IGNORECASE)
+
+# File extension -> category
+_FILE_CATEGORIES = {
+    **dict.fromkeys(("mp4", "mkv", "avi", "mov", "wmv", "flv"), "video"),
+    **dict.fromkeys(("zip", "rar", "7z", "tar", "gz"), "archive"),
+    **dict.fromkeys(("pdf", "epub", "mobi", "doc", "docx"), "document"),
+}
+
+# Anything that isn't a word character or whitespace is dropped from queries
+_QUERY_CLEAN_RE = re.compile(r'[^\w\s]')
+
+# Words that already mark a query as course- or download-related
+_COURSE_TERMS = ("course", "tutorial", "lessons", "training", "class")
+_FILE_INDICATORS = ("download", "files", "resources", "materials")
+
+# Title terms that raise or lower a result's quality score (substring matches)
+_POSITIVE_TITLE_TERMS = ("course", "tutorial", "complete", "full", "master", "class", "training")
+_NEGATIVE_TITLE_TERMS = ("preview", "sample", "demo", "trailer")
+
 class SearchEngine:
     """Enhanced search engine with multiple sources and better filtering"""
     
     def __init__(self):
         self.config = Config()
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        # Async client so a SerpAPI round-trip doesn't block the event loop. Idle
+        # connections are kept long enough that back-to-back searches skip the TLS handshake
+        self.session = httpx.AsyncClient(
+            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+            timeout=30,
+            # Concurrent searches share one SerpAPI connection (h2 comes with httpx[http2])
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=self.config.MAX_CONCURRENT_SEARCHES,
+                max_keepalive_connections=self.config.MAX_CONCURRENT_SEARCHES,
+                keepalive_expiry=self.config.SEARCH_KEEPALIVE_EXPIRY
+            )
+        )
+        # (SerpAPI query, max_results) -> filtered results, reused for SEARCH_CACHE_TTL
+        self._results_cache = TTLCache(self.config.SEARCH_CACHE_TTL, self.config.CACHE_MAXSIZE)
+        # Caps concurrent SerpAPI requests; cache hits never take a slot
+        self._request_slots = asyncio.Semaphore(self.config.MAX_CONCURRENT_SEARCHES)
+        # Searches currently waiting on SerpAPI, by the same key as the cache
+        self._inflight = {}
+    
+    async def close(self):
+        """Close the HTTP client and its pooled connections"""
+        await self.session.aclose()
     
     async def search_courses(self, query: str, platform: str = None, 
-                           max_results: int = None, progress_callback=None) -> Tuple[List[Dict], int]:
+                           max_results: int = None, progress_callback=None) -> Tuple[List[SearchResult], int]:
         """
         Search for course links with progress tracking
         
@@ -50,17 +120,23 @@ class SearchEngine:
             # Build search query
             search_query = self._build_search_query(query, platform)
             
-            if progress_callback:
-                await progress_callback("📡 Searching platforms...")
+            # Identical recent searches are answered without calling SerpAPI
+            cache_key = (search_query.lower(), max_results)
+            filtered_results = self._results_cache.get(cache_key)
+            if filtered_results is not None:
+                return filtered_results[:max_results], len(filtered_results)
             
-            # Perform search
-            results = await self._perform_search(search_query, max_results, progress_callback)
+            # Identical searches already running are joined instead of sent again
+            task = self._inflight.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(
+                    self._fetch_results(cache_key, search_query, max_results, progress_callback)
+                )
+                self._inflight[cache_key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
             
-            if progress_callback:
-                await progress_callback("🔄 Processing results...")
-            
-            # Filter and enhance results
-            filtered_results = self._filter_and_enhance_results(results)
+            # Shielded so one caller giving up does not cancel the search for the others
+            filtered_results = await asyncio.shield(task)
             
             if progress_callback:
                 await progress_callback("✅ Search completed!")
@@ -73,37 +149,46 @@ class SearchEngine:
                 await progress_callback("❌ Search failed")
             return [], 0
     
+    async def _fetch_results(self, cache_key, search_query: str, max_results: int,
+                             progress_callback=None) -> List[SearchResult]:
+        """Query SerpAPI, then filter the results and cache them under cache_key"""
+        if progress_callback:
+            await progress_callback("📡 Searching platforms...")
+        
+        # Perform search
+        async with self._request_slots:
+            results = await self._perform_search(search_query, max_results, progress_callback)
+        
+        if progress_callback:
+            await progress_callback("🔄 Processing results...")
+        
+        # Filter and enhance results
+        filtered_results = self._filter_and_enhance_results(results)
+        self._results_cache.set(cache_key, filtered_results)
+        return filtered_results
+    
     def _build_search_query(self, query: str, platform: str = None) -> str:
         """Build optimized search query"""
         # Clean and enhance query
-        clean_query = re.sub(r'[^\w\s]', ' ', query.strip())
+        clean_query = _QUERY_CLEAN_RE.sub(' ', query.strip())
         clean_query = ' '.join(clean_query.split())  # Remove extra spaces
+        query_lower = clean_query.lower()
         
         # Add common course-related terms
-        course_terms = ["course", "tutorial", "lessons", "training", "class"]
-        if not any(term in clean_query.lower() for term in course_terms):
+        if not any(term in query_lower for term in _COURSE_TERMS):
             clean_query += " course"
         
         # Add file type indicators
-        file_indicators = ["download", "files", "resources", "materials"]
-        if not any(indicator in clean_query.lower() for indicator in file_indicators):
+        if not any(indicator in query_lower for indicator in _FILE_INDICATORS):
             clean_query += " download"
         
-        # Platform-specific query building
-        if platform:
-            if platform in self.config.SUPPORTED_PLATFORMS:
-                return f'{clean_query} site:{platform}'
-        
-        # Multi-platform search
-        platform_queries = []
-        for p in self.config.SUPPORTED_PLATFORMS:
-            platform_queries.append(f"site:{p}")
-        
-        platform_string = " OR ".join(platform_queries)
-        return f'{clean_query} ({platform_string})'
+        # The site: clauses are precomputed by Config; unsupported platforms search everywhere
+        if platform not in self.config.SUPPORTED_PLATFORMS:
+            platform = None
+        return self.config.get_search_query_template(platform).format(query=clean_query)
     
     async def _perform_search(self, query: str, max_results: int, 
-                            progress_callback=None) -> List[Dict]:
+                            progress_callback=None) -> List[SearchResult]:
         """Perform the actual search using SERPAPI"""
         all_results = []
         
@@ -123,28 +208,30 @@ class SearchEngine:
                 await progress_callback("🌐 Querying search engine...")
             
             # Make search request
-            response = self.session.get(
+            response = await self.session.get(
                 "https://serpapi.com/search",
-                params=params,
-                timeout=30
+                params=params
             )
             response.raise_for_status()
             
-            data = response.json()
+            data = json_loads(response.content)
             
             if progress_callback:
                 await progress_callback("📋 Parsing results...")
             
+            # Every result of one response shares the same timestamp
+            found_at = datetime.now().isoformat()
+            
             # Process organic results
             for result in data.get("organic_results", []):
-                processed_result = self._process_search_result(result)
+                processed_result = self._process_search_result(result, found_at)
                 if processed_result:
                     all_results.append(processed_result)
             
             # Also check related searches and people also ask
-            await self._process_additional_results(data, all_results, progress_callback)
+            await self._process_additional_results(data, all_results, found_at, progress_callback)
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Search API request failed: {e}")
             raise Exception(f"Search service unavailable: {e}")
         except Exception as e:
@@ -153,7 +240,7 @@ class SearchEngine:
         
         return all_results
     
-    def _process_search_result(self, result: Dict) -> Optional[Dict]:
+    def _process_search_result(self, result: Dict, found_at: str) -> Optional[SearchResult]:
         """Process individual search result"""
         try:
             link = result.get("link", "")
@@ -168,29 +255,29 @@ class SearchEngine:
             platform = self._identify_platform(link)
             file_info = self._extract_file_info(link, title, snippet)
             
-            return {
-                "title": title.strip(),
-                "link": link,
-                "snippet": snippet.strip(),
-                "platform": platform,
-                "file_info": file_info,
-                "quality_score": self._calculate_quality_score(title, snippet, link),
-                "found_at": datetime.now().isoformat()
-            }
+            return SearchResult(
+                title=title.strip(),
+                link=link,
+                snippet=snippet.strip(),
+                platform=platform,
+                file_info=file_info,
+                quality_score=self._calculate_quality_score(title, snippet, link),
+                found_at=found_at
+            )
             
         except Exception as e:
             logger.error(f"Failed to process result: {e}")
             return None
     
-    async def _process_additional_results(self, data: Dict, all_results: List[Dict], 
-                                        progress_callback=None):
+    async def _process_additional_results(self, data: Dict, all_results: List[SearchResult], 
+                                        found_at: str, progress_callback=None):
         """Process additional result sections"""
         try:
             # Process "People also ask" section
             paa_results = data.get("people_also_ask", [])
             for paa in paa_results[:3]:  # Limit to avoid spam
                 if "link" in paa and self.config.is_valid_platform(paa["link"]):
-                    processed = self._process_search_result(paa)
+                    processed = self._process_search_result(paa, found_at)
                     if processed:
                         all_results.append(processed)
             
@@ -203,51 +290,52 @@ class SearchEngine:
         except Exception as e:
             logger.error(f"Failed to process additional results: {e}")
     
-    def _filter_and_enhance_results(self, results: List[Dict]) -> List[Dict]:
+    def _filter_and_enhance_results(self, results: List[SearchResult]) -> List[SearchResult]:
         """Filter and enhance search results"""
         filtered_results = []
-        seen_links = set()
         
+        # Collapse duplicates of the same link, keeping the best-scored copy
+        unique_results = {}
         for result in results:
-            link = result.get("link", "")
-            
-            # Skip duplicates
-            if link in seen_links:
-                continue
-            seen_links.add(link)
-            
+            key = self._normalize_link(result.link)
+            kept = unique_results.get(key)
+            if kept is None or result.quality_score > kept.quality_score:
+                unique_results[key] = result
+        
+        for result in unique_results.values():
             # Quality filtering
-            if result.get("quality_score", 0) < 3:
+            if result.quality_score < 3:
                 continue
             
             # Enhanced metadata
-            result["display_title"] = self._create_display_title(result)
-            result["platform_emoji"] = self._get_platform_emoji(result["platform"])
-            result["estimated_size"] = self._estimate_content_size(result)
+            result.display_title = self._create_display_title(result)
+            result.platform_emoji = self._get_platform_emoji(result.platform)
+            result.estimated_size = self._estimate_content_size(result)
             
             filtered_results.append(result)
         
         # Sort by quality score
-        filtered_results.sort(key=lambda x: x.get("quality_score", 0), reverse=True)
+        filtered_results.sort(key=attrgetter("quality_score"), reverse=True)
         
         return filtered_results
     
+    def _normalize_link(self, link: str) -> str:
+        """Duplicate-detection key for a link: lowercase scheme/host, no utm_* parameters"""
+        if "://" not in link:
+            return link
+        
+        parts = urlsplit(link)
+        query = parts.query
+        if "utm_" in query:
+            query = urlencode([(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+                               if not k.startswith("utm_")])
+        # Path, remaining query and fragment identify the file (Drive ids, Mega keys)
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, parts.fragment))
+    
     def _identify_platform(self, url: str) -> str:
         """Identify platform from URL"""
-        url_lower = url.lower()
-        
-        if "drive.google.com" in url_lower:
-            return "Google Drive"
-        elif "mediafire.com" in url_lower:
-            return "MediaFire"
-        elif "mega.nz" in url_lower:
-            return "Mega"
-        elif "dropbox.com" in url_lower:
-            return "Dropbox"
-        elif "onedrive.live.com" in url_lower:
-            return "OneDrive"
-        else:
-            return "Unknown"
+        domain = self.config.match_platform(url)
+        return self.config.PLATFORM_INFO[domain][0] if domain else "Unknown"
     
     def _extract_file_info(self, link: str, title: str, snippet: str) -> Dict:
         """Extract file information from link and metadata"""
@@ -257,15 +345,16 @@ class SearchEngine:
             "format": None
         }
         
-        # Extract file type from URL or title
-        file_extensions = re.findall(r'\.(zip|rar|7z|tar|gz|mp4|mkv|avi|pdf|epub|mobi)(?:\s|$|[?&#])', 
-                                   f"{link} {title} {snippet}", re.IGNORECASE)
-        if file_extensions:
-            info["format"] = file_extensions[0].lower()
-            info["type"] = self._categorize_file_type(info["format"])
+        # Extract file type from URL, title or snippet (first hit wins)
+        for text in (link, title, snippet):
+            ext_match = _FILE_EXT_RE.search(text)
+            if ext_match:
+                info["format"] = ext_match.group(1).lower()
+                info["type"] = self._categorize_file_type(info["format"])
+                break
         
         # Extract size information
-        size_match = re.search(r'(\d+(?:\.\d+)?)\s*(MB|GB|TB)', snippet, re.IGNORECASE)
+        size_match = _SIZE_RE.search(snippet)
         if size_match:
             info["size"] = f"{size_match.group(1)} {size_match.group(2).upper()}"
         
@@ -273,33 +362,19 @@ class SearchEngine:
     
     def _categorize_file_type(self, extension: str) -> str:
         """Categorize file type based on extension"""
-        video_formats = ["mp4", "mkv", "avi", "mov", "wmv", "flv"]
-        archive_formats = ["zip", "rar", "7z", "tar", "gz"]
-        document_formats = ["pdf", "epub", "mobi", "doc", "docx"]
-        
-        if extension in video_formats:
-            return "video"
-        elif extension in archive_formats:
-            return "archive"
-        elif extension in document_formats:
-            return "document"
-        else:
-            return "unknown"
+        return _FILE_CATEGORIES.get(extension, "unknown")
     
     def _calculate_quality_score(self, title: str, snippet: str, link: str) -> int:
         """Calculate quality score for result ranking"""
         score = 5  # Base score
         
         # Title quality indicators
-        positive_title_terms = ["course", "tutorial", "complete", "full", "master", "class", "training"]
-        negative_title_terms = ["preview", "sample", "demo", "trailer"]
-        
         title_lower = title.lower()
-        for term in positive_title_terms:
+        for term in _POSITIVE_TITLE_TERMS:
             if term in title_lower:
                 score += 2
         
-        for term in negative_title_terms:
+        for term in _NEGATIVE_TITLE_TERMS:
             if term in title_lower:
                 score -= 3
         
@@ -309,7 +384,7 @@ class SearchEngine:
             score += 1
         if "free" in snippet_lower:
             score += 1
-        if any(size in snippet_lower for size in ["gb", "mb"]):
+        if "gb" in snippet_lower or "mb" in snippet_lower:
             score += 2
         
         # Link quality (shorter, cleaner links often better)
@@ -324,11 +399,10 @@ class SearchEngine:
         
         return max(0, min(10, score))  # Clamp between 0-10
     
-    def _create_display_title(self, result: Dict) -> str:
+    def _create_display_title(self, result: SearchResult) -> str:
         """Create enhanced display title"""
-        title = result.get("title", "Untitled")
-        platform = result.get("platform", "Unknown")
-        file_info = result.get("file_info", {})
+        title = result.title
+        file_info = result.file_info
         
         # Add file size if available
         if file_info.get("size"):
@@ -342,18 +416,11 @@ class SearchEngine:
     
     def _get_platform_emoji(self, platform: str) -> str:
         """Get emoji for platform"""
-        emoji_map = {
-            "Google Drive": "📁",
-            "MediaFire": "💾",
-            "Mega": "☁️",
-            "Dropbox": "📦",
-            "OneDrive": "🌐"
-        }
-        return emoji_map.get(platform, "🔗")
+        return _PLATFORM_EMOJI.get(platform, "🔗")
     
-    def _estimate_content_size(self, result: Dict) -> str:
+    def _estimate_content_size(self, result: SearchResult) -> str:
         """Estimate content size category"""
-        snippet = result.get("snippet", "").lower()
+        snippet = result.snippet.lower()
         
         if "gb" in snippet:
             return "Large (1GB+)"
@@ -365,28 +432,48 @@ class SearchEngine:
 class SearchProgress:
     """Helper class for managing search progress"""
     
+    # Telegram tolerates roughly one edit per second per message
+    MIN_EDIT_INTERVAL = 1.0
+    
     def __init__(self, message, config: Config):
         self.message = message
         self.config = config
         self.current_frame = 0
         self.is_active = True
+        # The message was just sent, so the first edit waits a full interval
+        self._last_edit = time.monotonic()
+        self._last_text = None
+        # Edit request currently on its way to Telegram, if any
+        self._edit_task = None
     
     async def update(self, text: str):
-        """Update progress message"""
-        if not self.is_active:
+        """Update progress message without waiting for the edit (at most once per MIN_EDIT_INTERVAL)"""
+        if not self.is_active or text == self._last_text:
+            return
+        
+        # Drop this frame while the previous edit is still in flight
+        if self._edit_task is not None and not self._edit_task.done():
             return
         
+        now = time.monotonic()
+        if now - self._last_edit < self.MIN_EDIT_INTERVAL:
+            return
+        self._last_edit = now
+        self._last_text = text
+        
+        emoji = self.config.PROGRESS_FRAMES[self.current_frame % len(self.config.PROGRESS_FRAMES)]
+        self.current_frame += 1
+        self._edit_task = asyncio.create_task(self._edit(f"{emoji} {text}"))
+    
+    async def _edit(self, text: str):
+        """Send one progress edit"""
         try:
-            emoji = self.config.PROGRESS_FRAMES[self.current_frame % len(self.config.PROGRESS_FRAMES)]
-            await self.message.edit_text(f"{emoji} {text}")
-            self.current_frame += 1
-            
-            # Small delay for visual effect
-            await asyncio.sleep(0.3)
-            
+            await self.message.edit_text(text)
         except Exception as e:
             logger.error(f"Progress update failed: {e}")
     
-    def stop(self):
-        """Stop progress updates"""
+    async def stop(self):
+        """Stop progress updates, waiting for an in-flight edit so it can't land after the final message"""
         self.is_active = False
+        if self._edit_task is not None:
+            await self._edit_task
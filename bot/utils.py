@@ -5,29 +5,52 @@ Contains helper functions for formatting, validation, and common operations
 
 import re
 import html
+import time
 import logging
+import functools
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 from urllib.parse import urlparse
 import hashlib
+from telegram.helpers import escape_markdown
+
+from bot.config import Config
+from bot.search import SearchResult
 
 logger = logging.getLogger(__name__)
 
-class MessageFormatter:
-    """Class for formatting bot messages with enhanced styling"""
-    
-    @staticmethod
-    def format_welcome_message(user_name: str) -> str:
-        """Format welcome message for new users"""
-        from bot.config import Config
-        config = Config()
-        return f"""
+# Patterns used by Validator and TextUtils
+_QUERY_CHARS_RE = re.compile(r'^[\w\s\-\.\(\)\[\]]+$', re.UNICODE)
+_WORD_RE = re.compile(r'\b\w+\b')
+_NON_WORD_RE = re.compile(r'\W+')
+
+# Characters stripped from user input by Validator.sanitize_input
+_UNSAFE_CHARS_TABLE = str.maketrans('', '', '<>"\'')
+
+# Schemes is_valid_url can accept from a plain string split; anything else goes through urlparse
+_FAST_URL_SCHEMES = ("http://", "https://", "ftp://")
+_HOST_STOP_RE = re.compile(r'[/?#]')
+
+# Star ratings by half quality score (scores are clamped to 0-10)
+_STAR_STRINGS = tuple("⭐" * i for i in range(6))
+
+# Words too common to be useful as keywords
+_STOP_WORDS = frozenset({"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"})
+
+@functools.lru_cache(maxsize=2048)
+def _parse_timestamp(value: str) -> datetime:
+    """Parse a stored ISO timestamp (before 3.11 fromisoformat rejects a trailing Z)"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+# Welcome and help bodies only depend on Config, so they are built once at import
+_WELCOME_TEMPLATE = f"""
 ```
 🅲🅾🆄🆁🆂🅴 🅵🅸🅽🅳🅴🆁 🅱🅾🆃
 ✧═══════════════════════════════✧
 ```
 
-🎓 **𝗪𝗲𝗹𝗰𝗼𝗺𝗲 {user_name}!** [`[ϟ]`]({config.CHANNEL_LINK})
+🎓 **𝗪𝗲𝗹𝗰𝗼𝗺𝗲 {{user_name}}!** [`[ϟ]`]({Config.CHANNEL_LINK})
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -47,25 +70,20 @@ class MessageFormatter:
 `💡` Use /help for detailed commands  
 `💡` Try the menu buttons below
 
-**𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿:** [{config.DEVELOPER_TELEGRAM}](https://t.me/{config.DEVELOPER_TELEGRAM[1:]})
+**𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿:** [{Config.DEVELOPER_TELEGRAM}](https://t.me/{Config.DEVELOPER_TELEGRAM[1:]})
 
 ```
 ✧═══════ 𝗟𝗘𝗧'𝗦 𝗙𝗜𝗡𝗗 𝗖𝗢𝗨𝗥𝗦𝗘𝗦! ═══════✧
 ```
 """
-    
-    @staticmethod
-    def format_help_message() -> str:
-        """Format comprehensive help message"""
-        from bot.config import Config
-        config = Config()
-        return f"""
+
+_HELP_MESSAGE = f"""
 ```
 🅷🅴🅻🅿 & 🅶🆄🅸🅳🅴
 ✧═══════════════════════════════✧
 ```
 
-📖 **𝗖𝗼𝘂𝗿𝘀𝗲 𝗕𝗼𝘁 𝗛𝗲𝗹𝗽 𝗖𝗲𝗻𝘁𝗲𝗿** [`[ϟ]`]({config.CHANNEL_LINK})
+📖 **𝗖𝗼𝘂𝗿𝘀𝗲 𝗕𝗼𝘁 𝗛𝗲𝗹𝗽 𝗖𝗲𝗻𝘁𝗲𝗿** [`[ϟ]`]({Config.CHANNEL_LINK})
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -109,15 +127,49 @@ class MessageFormatter:
 `🎯` Check favorites regularly
 `🎯` Use history for repeat searches
 
-**𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿:** [{config.DEVELOPER_TELEGRAM}](https://t.me/{config.DEVELOPER_TELEGRAM[1:]})
+**𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿:** [{Config.DEVELOPER_TELEGRAM}](https://t.me/{Config.DEVELOPER_TELEGRAM[1:]})
 
 ```
 ✧═══════ 𝗛𝗔𝗣𝗣𝗬 𝗦𝗘𝗔𝗥𝗖𝗛𝗜𝗡𝗚! ═══════✧
 ```
 """
+
+# Message bodies for MessageFormatter.format_error_message / format_success_message
+_ERROR_MESSAGES = {
+    "search_failed": "🔍 **Search Failed**\n\nThe search service is temporarily unavailable. Please try again in a few moments.",
+    "rate_limit": "⏰ **Rate Limit Exceeded**\n\nYou've made too many searches recently. Please wait a moment before searching again.",
+    "invalid_query": "❓ **Invalid Query**\n\nPlease enter a valid course name to search for.",
+    "no_results": "📭 **No Results Found**\n\nTry using different keywords or check your spelling.",
+    "api_error": "🔧 **Service Error**\n\nOur search service is experiencing issues. Please try again later.",
+    "network_error": "🌐 **Network Error**\n\nPlease check your connection and try again."
+}
+
+_SUCCESS_MESSAGES = {
+    "added_favorite": "⭐ **Added to Favorites!**\n\nThe link has been saved to your favorites collection.",
+    "removed_favorite": "🗑️ **Removed from Favorites**\n\nThe link has been removed from your collection.",
+    "settings_updated": "⚙️ **Settings Updated**\n\nYour preferences have been saved successfully.",
+    "history_cleared": "🗑️ **History Cleared**\n\nYour search history has been cleared.",
+    "data_exported": "📤 **Data Exported**\n\nYour data has been prepared for export."
+}
+
+class MessageFormatter:
+    """Class for formatting bot messages with enhanced styling"""
+    
+    __slots__ = ()
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def format_welcome_message(user_name: str) -> str:
+        """Format welcome message for new users (cached per name)"""
+        return _WELCOME_TEMPLATE.format(user_name=escape_markdown(user_name))
     
     @staticmethod
-    def format_search_results(results: List[Dict], query: str, 
+    def format_help_message() -> str:
+        """Format comprehensive help message"""
+        return _HELP_MESSAGE
+    
+    @staticmethod
+    def format_search_results(results: List[SearchResult], query: str, 
                             page: int = 0, total_results: int = 0) -> str:
         """Format search results with enhanced display"""
         if not results:
@@ -159,13 +211,13 @@ class MessageFormatter:
 
 """
         
-        results_text = ""
+        items = []
         for i, result in enumerate(results, 1):
-            platform_emoji = result.get("platform_emoji", "🔗")
-            title = result.get("display_title", result.get("title", "Untitled"))
-            snippet = result.get("snippet", "")
-            platform = result.get("platform", "Unknown")
-            quality_score = result.get("quality_score", 0)
+            platform_emoji = result.platform_emoji
+            title = result.display_title or result.title or "Untitled"
+            snippet = result.snippet
+            platform = result.platform
+            quality_score = result.quality_score
             
             # Truncate long titles and snippets
             if len(title) > 50:
@@ -173,10 +225,10 @@ class MessageFormatter:
             if len(snippet) > 80:
                 snippet = snippet[:77] + "..."
             
-            quality_stars = "⭐" * min(quality_score // 2, 5)
+            quality_stars = _STAR_STRINGS[min(quality_score // 2, 5)]
             
-            results_text += f"""
-**`{i}.`** {platform_emoji} **{html.escape(title)}** `[ϟ]`
+            items.append(f"""
+**`{i}.`** {platform_emoji} **{escape_markdown(title)}** `[ϟ]`
 ```
 Platform: {platform} {quality_stars}
 Info: {html.escape(snippet)}
@@ -184,7 +236,7 @@ Info: {html.escape(snippet)}
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-"""
+""")
         
         footer = """
 **💡 Pro Tip:** `Click result for details` • `⭐ to save favorites`
@@ -194,31 +246,31 @@ Info: {html.escape(snippet)}
 ```
 """
         
-        return header + results_text + footer
+        return header + "".join(items) + footer
     
     @staticmethod
-    def format_result_details(result: Dict, index: int) -> str:
+    def format_result_details(result: SearchResult, index: int) -> str:
         """Format detailed view of a single result"""
-        title = result.get("title", "Untitled")
-        link = result.get("link", "")
-        snippet = result.get("snippet", "")
-        platform = result.get("platform", "Unknown")
-        platform_emoji = result.get("platform_emoji", "🔗")
-        file_info = result.get("file_info", {})
-        quality_score = result.get("quality_score", 0)
-        estimated_size = result.get("estimated_size", "Unknown")
+        title = result.title or "Untitled"
+        link = result.link
+        snippet = result.snippet
+        platform = result.platform
+        platform_emoji = result.platform_emoji
+        file_info = result.file_info
+        quality_score = result.quality_score
+        estimated_size = result.estimated_size
         
         details = f"""
 ```
 ✧═══════ COURSE DETAILS ═══════✧
 ```
 
-{platform_emoji} **{html.escape(title)}** `[ϟ]`
+{platform_emoji} **{escape_markdown(title)}** `[ϟ]`
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 **📱 Platform:** `{platform}`
-**📊 Quality:** `{quality_score}/10` {"⭐" * min(quality_score // 2, 5)}
+**📊 Quality:** `{quality_score}/10` {_STAR_STRINGS[min(quality_score // 2, 5)]}
 **📏 Size:** `{estimated_size}`
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -308,7 +360,7 @@ Info: {html.escape(snippet)}
 
 """
         
-        favorites_text = ""
+        items = []
         for i, fav in enumerate(favorites[start_idx:end_idx], start_idx + 1):
             platform_emoji = MessageFormatter._get_platform_emoji(fav.get('url', ''))
             title = fav.get('title', 'Untitled')
@@ -318,7 +370,7 @@ Info: {html.escape(snippet)}
             # Format date
             try:
                 if added_date:
-                    date_obj = datetime.fromisoformat(added_date.replace('Z', '+00:00'))
+                    date_obj = _parse_timestamp(added_date)
                     formatted_date = date_obj.strftime('%b %d')
                 else:
                     formatted_date = "Unknown"
@@ -328,15 +380,15 @@ Info: {html.escape(snippet)}
             if len(title) > 45:
                 title = title[:42] + "..."
             
-            favorites_text += f"""
-**`{i}.`** {platform_emoji} **{html.escape(title)}** `[ϟ]`
+            items.append(f"""
+**`{i}.`** {platform_emoji} **{escape_markdown(title)}** `[ϟ]`
 ```
 Platform: {platform} • Added: {formatted_date}
 ```
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-"""
+""")
         
         footer = """
 **💡 Actions:** `Open Link` • `Remove from Favorites` • `Export All`
@@ -346,7 +398,7 @@ Platform: {platform} • Added: {formatted_date}
 ```
 """
         
-        return header + favorites_text + footer
+        return header + "".join(items) + footer
     
     @staticmethod
     def format_search_history(history: List[Dict]) -> str:
@@ -390,7 +442,8 @@ Platform: {platform} • Added: {formatted_date}
 
 """
         
-        history_text = ""
+        items = []
+        today = datetime.now().date()
         for i, search in enumerate(history, 1):
             query = search.get('query', 'Unknown')
             results_count = search.get('results_count', 0)
@@ -399,8 +452,8 @@ Platform: {platform} • Added: {formatted_date}
             # Format timestamp
             try:
                 if timestamp:
-                    date_obj = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    if date_obj.date() == datetime.now().date():
+                    date_obj = _parse_timestamp(timestamp)
+                    if date_obj.date() == today:
                         formatted_time = date_obj.strftime('%H:%M')
                     else:
                         formatted_time = date_obj.strftime('%b %d')
@@ -414,15 +467,15 @@ Platform: {platform} • Added: {formatted_date}
             
             results_emoji = "✅" if results_count > 0 else "❌"
             
-            history_text += f"""
-**`{i}.`** 🔍 **{html.escape(query)}** `[ϟ]`
+            items.append(f"""
+**`{i}.`** 🔍 **{escape_markdown(query)}** `[ϟ]`
 ```
 Results: {results_count} • Time: {formatted_time} {results_emoji}
 ```
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-"""
+""")
         
         footer = """
 **💡 Actions:** `Click any search to run again` • `Export History`
@@ -432,34 +485,7 @@ Results: {results_count} • Time: {formatted_time} {results_emoji}
 ```
 """
         
-        return header + history_text + footer
-
-    @staticmethod
-    def export_favorites_text(favorites: List[Dict]) -> str:
-        """Export favorites as formatted text"""
-        if not favorites:
-            return "No favorites to export."
-        
-        from datetime import datetime
-        export_text = f"""
-𝗖𝗼𝘂𝗿𝘀𝗲 𝗙𝗮𝘃𝗼𝗿𝗶𝘁𝗲𝘀 𝗘𝘅𝗽𝗼𝗿𝘁
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-Total items: {len(favorites)}
-
-{'='*50}
-
-"""
-        
-        for i, fav in enumerate(favorites, 1):
-            export_text += f"""
-{i}. {fav.get('title', 'Untitled')}
-   Platform: {fav.get('platform', 'Unknown')}
-   URL: {fav.get('url', '')}
-   Added: {fav.get('added_at', 'Unknown')}
-
-"""
-        
-        return export_text
+        return header + "".join(items) + footer
     
     @staticmethod
     def format_settings_display(settings: Dict) -> str:
@@ -507,19 +533,10 @@ Show quality scores: {'Yes' if settings.get('show_scores', True) else 'No'}
     @staticmethod
     def format_error_message(error_type: str, details: str = "") -> str:
         """Format error messages with helpful information"""
-        error_messages = {
-            "search_failed": "🔍 **Search Failed**\n\nThe search service is temporarily unavailable. Please try again in a few moments.",
-            "rate_limit": "⏰ **Rate Limit Exceeded**\n\nYou've made too many searches recently. Please wait a moment before searching again.",
-            "invalid_query": "❓ **Invalid Query**\n\nPlease enter a valid course name to search for.",
-            "no_results": "📭 **No Results Found**\n\nTry using different keywords or check your spelling.",
-            "api_error": "🔧 **Service Error**\n\nOur search service is experiencing issues. Please try again later.",
-            "network_error": "🌐 **Network Error**\n\nPlease check your connection and try again."
-        }
-        
-        base_message = error_messages.get(error_type, "❌ **An error occurred**\n\nPlease try again.")
+        base_message = _ERROR_MESSAGES.get(error_type, "❌ **An error occurred**\n\nPlease try again.")
         
         if details:
-            base_message += f"\n\n**Details:** {details}"
+            base_message += f"\n\n**Details:** {escape_markdown(details)}"
         
         base_message += "\n\n💡 **Tip:** If the problem persists, try using the /help command for guidance."
         
@@ -528,15 +545,7 @@ Show quality scores: {'Yes' if settings.get('show_scores', True) else 'No'}
     @staticmethod
     def format_success_message(action: str, details: str = "") -> str:
         """Format success messages"""
-        success_messages = {
-            "added_favorite": "⭐ **Added to Favorites!**\n\nThe link has been saved to your favorites collection.",
-            "removed_favorite": "🗑️ **Removed from Favorites**\n\nThe link has been removed from your collection.",
-            "settings_updated": "⚙️ **Settings Updated**\n\nYour preferences have been saved successfully.",
-            "history_cleared": "🗑️ **History Cleared**\n\nYour search history has been cleared.",
-            "data_exported": "📤 **Data Exported**\n\nYour data has been prepared for export."
-        }
-        
-        base_message = success_messages.get(action, "✅ **Success!**\n\nThe action was completed successfully.")
+        base_message = _SUCCESS_MESSAGES.get(action, "✅ **Success!**\n\nThe action was completed successfully.")
         
         if details:
             base_message += f"\n\n{details}"
@@ -544,25 +553,17 @@ Show quality scores: {'Yes' if settings.get('show_scores', True) else 'No'}
         return base_message
     
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def _get_platform_emoji(url: str) -> str:
         """Get platform emoji from URL"""
-        url_lower = url.lower()
-        if "drive.google.com" in url_lower:
-            return "📁"
-        elif "mediafire.com" in url_lower:
-            return "💾"
-        elif "mega.nz" in url_lower:
-            return "☁️"
-        elif "dropbox.com" in url_lower:
-            return "📦"
-        elif "onedrive.live.com" in url_lower:
-            return "🌐"
-        else:
-            return "🔗"
+        domain = Config.match_platform(url)
+        return Config.PLATFORM_INFO[domain][1] if domain else "🔗"
 
 class Validator:
     """Input validation utilities"""
     
+    __slots__ = ()
+    
     @staticmethod
     def is_valid_search_query(query: str) -> bool:
         """Validate search query"""
@@ -574,7 +575,7 @@ class Validator:
             return False
         
         # Check for valid characters (allow unicode for international course names)
-        if not re.match(r'^[\w\s\-\.\(\)\[\]]+$', query, re.UNICODE):
+        if not _QUERY_CHARS_RE.match(query):
             return False
         
         return True
@@ -583,6 +584,12 @@ class Validator:
     def is_valid_url(url: str) -> bool:
         """Validate URL format"""
         try:
+            if url.startswith(_FAST_URL_SCHEMES):
+                host = _HOST_STOP_RE.split(url[url.index("://") + 3:], 1)[0]
+                # Control characters and bracketed IPv6 hosts need urlparse's handling
+                if host and host.isprintable() and "[" not in host and "]" not in host:
+                    return True
+            
             result = urlparse(url)
             return all([result.scheme, result.netloc])
         except:
@@ -595,7 +602,7 @@ class Validator:
             return ""
         
         # Remove potentially dangerous characters
-        sanitized = re.sub(r'[<>"\']', '', text)
+        sanitized = text.translate(_UNSAFE_CHARS_TABLE)
         
         # Limit length
         if len(sanitized) > 200:
@@ -604,32 +611,37 @@ class Validator:
         return sanitized.strip()
 
 class RateLimiter:
-    """Simple rate limiting utility"""
+    """Token-bucket rate limiting utility (one bucket per user)"""
+    
+    # Upper bound on tracked users; the least recently seen are dropped first
+    MAX_TRACKED_USERS = 10000
+    
+    __slots__ = ("buckets",)
     
     def __init__(self):
-        self.requests = {}
+        # user_id -> (tokens, last update), least recently seen first
+        self.buckets: OrderedDict = OrderedDict()
     
     def is_allowed(self, user_id: int, limit: int = 10, window: int = 60) -> bool:
-        """Check if user is within rate limits"""
-        now = datetime.now()
-        
-        if user_id not in self.requests:
-            self.requests[user_id] = []
-        
-        # Clean old requests
-        cutoff = now - timedelta(seconds=window)
-        self.requests[user_id] = [
-            req_time for req_time in self.requests[user_id] 
-            if req_time > cutoff
-        ]
-        
-        # Check limit
-        if len(self.requests[user_id]) >= limit:
-            return False
-        
-        # Add current request
-        self.requests[user_id].append(now)
-        return True
+        """Check if user is within rate limits (bursts of up to limit, refilled over window)"""
+        now = time.monotonic()
+        
+        # Refill for the time since the last request, capped at a full bucket
+        tokens, last = self.buckets.pop(user_id, (limit, now))
+        tokens = min(limit, tokens + (now - last) * limit / window)
+        allowed = tokens >= 1.0
+        self.buckets[user_id] = (tokens - allowed, now)
+        
+        # Drop buckets that have refilled completely, and beyond the cap the
+        # least recently seen ones; each is removed once, so this is O(1) amortized
+        buckets = self.buckets
+        while buckets:
+            seen = next(iter(buckets.values()))[1]
+            if now - seen < window and len(buckets) <= self.MAX_TRACKED_USERS:
+                break
+            buckets.popitem(last=False)
+        
+        return allowed
 
 class TextUtils:
     """Text processing utilities"""
@@ -644,22 +656,17 @@ class TextUtils:
     @staticmethod
     def extract_keywords(text: str) -> List[str]:
         """Extract keywords from text"""
-        # Remove common stop words
-        stop_words = {"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"}
-        
         # Extract words
-        words = re.findall(r'\b\w+\b', text.lower())
-        
-        # Filter out stop words and short words
-        keywords = [word for word in words if len(word) > 2 and word not in stop_words]
+        words = _WORD_RE.findall(text.lower())
         
-        return list(set(keywords))  # Remove duplicates
+        # Filter out stop words and short words, dropping duplicates but keeping first-seen order
+        return list(dict.fromkeys(word for word in words if len(word) > 2 and word not in _STOP_WORDS))
     
     @staticmethod
     def create_fingerprint(text: str) -> str:
         """Create a fingerprint for text deduplication"""
-        normalized = re.sub(r'\W+', '', text.lower())
-        return hashlib.md5(normalized.encode()).hexdigest()
+        normalized = _NON_WORD_RE.sub('', text.lower())
+        return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
 
 class ExportUtils:
     """Data export utilities"""
@@ -671,7 +678,7 @@ class ExportUtils:
             return "No favorites to export."
         
         export_text = f"""
-📚 Course Favorites Export
+𝗖𝗼𝘂𝗿𝘀𝗲 𝗙𝗮𝘃𝗼𝗿𝗶𝘁𝗲𝘀 𝗘𝘅𝗽𝗼𝗿𝘁
 Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 Total items: {len(favorites)}
 
@@ -679,16 +686,16 @@ Total items: {len(favorites)}
 
 """
         
-        for i, fav in enumerate(favorites, 1):
-            export_text += f"""
+        return export_text + "".join(
+            f"""
 {i}. {fav.get('title', 'Untitled')}
    Platform: {fav.get('platform', 'Unknown')}
-   URL: {fav.get('url', 'No URL')}
-   Added: {fav.get('added_at', 'Unknown date')}
+   URL: {fav.get('url', '')}
+   Added: {fav.get('added_at', 'Unknown')}
 
 """
-        
-        return export_text
+            for i, fav in enumerate(favorites, 1)
+        )
     
     @staticmethod
     def export_history_text(history: List[Dict]) -> str:
@@ -705,12 +712,15 @@ Total searches: {len(history)}
 
 """
         
-        for i, search in enumerate(history, 1):
-            export_text += f"""
+        return export_text + "".join(
+            f"""
 {i}. Query: "{search.get('query', 'Unknown')}"
    Results found: {search.get('results_count', 0)}
    Date: {search.get('timestamp', 'Unknown')}
 
 """
-        
-        return export_text
+            for i, search in enumerate(history, 1)
+        )
+
+# The bot's favorites export lives in ExportUtils; MessageFormatter exposes the same function
+MessageFormatter.export_favorites_text = staticmethod(ExportUtils.export_favorites_text)
@@ -7,12 +7,14 @@ Main entry point for the application
 import asyncio
 import logging
 import os
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram.ext import (
+    AIORateLimiter, Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+)
 
 from bot.config import Config
 from bot.handlers import (
     start_handler, help_handler, search_handler, callback_handler,
-    settings_handler, history_handler, favorites_handler
+    settings_handler, history_handler, favorites_handler, db, run_db, search_engine
 )
 from bot.database import Database
 
@@ -23,6 +25,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# /command -> handler, registered in this order
+COMMAND_HANDLERS = (
+    ("start", start_handler),
+    ("help", help_handler),
+    ("settings", settings_handler),
+    ("history", history_handler),
+    ("favorites", favorites_handler),
+)
+
 async def error_handler(update, context):
     """Log errors and send user-friendly messages"""
     logger.error(f"Update {update} caused error {context.error}")
@@ -33,23 +44,47 @@ async def error_handler(update, context):
             "If the problem persists, contact support."
         )
 
+async def flush_history_periodically():
+    """Flush queued search history even when no new searches arrive"""
+    while True:
+        await asyncio.sleep(Database.HISTORY_FLUSH_INTERVAL)
+        # One failed flush (e.g. "database is locked") must not end the loop
+        try:
+            await run_db(db.flush_search_history)
+        except Exception as e:
+            logger.exception(f"Periodic history flush failed: {e}")
+
+async def post_init(application):
+    """Start background maintenance tasks"""
+    application.bot_data["history_flusher"] = asyncio.create_task(flush_history_periodically())
+
+async def post_shutdown(application):
+    """Stop background tasks, write out anything still queued and close the search client"""
+    flusher = application.bot_data.pop("history_flusher", None)
+    if flusher:
+        flusher.cancel()
+    await run_db(db.flush_search_history)
+    await search_engine.close()
+
 def main():
     """Main function to start the bot"""
     # Initialize configuration
     config = Config()
     
-    # Initialize database
-    db = Database()
-    
     # Create application
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        # Queue outgoing calls under Telegram's flood limits instead of hitting 429s
+        .rate_limiter(AIORateLimiter(max_retries=config.TELEGRAM_MAX_RETRIES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Add handlers
-    application.add_handler(CommandHandler("start", start_handler))
-    application.add_handler(CommandHandler("help", help_handler))
-    application.add_handler(CommandHandler("settings", settings_handler))
-    application.add_handler(CommandHandler("history", history_handler))
-    application.add_handler(CommandHandler("favorites", favorites_handler))
+    for command, handler in COMMAND_HANDLERS:
+        application.add_handler(CommandHandler(command, handler))
     
     # Message handlers
     application.add_handler(MessageHandler(
@@ -73,7 +108,9 @@ def main():
             timeout=10,
             bootstrap_retries=3,
             read_timeout=30,
-            write_timeout=30
+            write_timeout=30,
+            # Skip whatever queued up while the bot was down instead of replaying it
+            drop_pending_updates=True
         )
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")